@@ -0,0 +1,37 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / 'winterholiday'
+
+
+def _load(filename: str, module_name: str):
+    """按文件路径导入模块（源文件名是数字，不能直接 import）"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, PACKAGE_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def analyzer_module():
+    return _load('3.py', 'winterholiday_stock_analyzer')
+
+
+@pytest.fixture(scope='session')
+def library_module():
+    return _load('2.py', 'winterholiday_library')
+
+
+@pytest.fixture
+def library(library_module):
+    library_module.LibrarySystem.reset_instance()
+    system = library_module.LibrarySystem()
+    yield system
+    system.detach_storage()
+    library_module.LibrarySystem.reset_instance()
@@ -0,0 +1,233 @@
+def _add_books(module, library, count, copies=2):
+    author = module.Author("Author", 1970, "Unknown")
+    for i in range(count):
+        library.add_book(module.Book(f"Book {i}", author, f"ISBN{i}", copies))
+
+
+def _recover(module, directory):
+    module.LibrarySystem.reset_instance()
+    recovered = module.LibrarySystem()
+    recovered.attach_storage(module.LibraryStorage(directory, snapshot_every=None))
+    return recovered
+
+
+def test_snapshot_with_register_and_borrow_during_export(library_module, library, tmp_path, monkeypatch):
+    storage = library_module.LibraryStorage(tmp_path, snapshot_every=None)
+    library.attach_storage(storage)
+    _add_books(library_module, library, 3)
+    library.borrow_book(library.register_user("Early"), "ISBN0")
+
+    export = library._snapshot_records
+
+    def _interleaved():
+        records = export()
+        yield next(records)  # ISBN0 已导出
+        user_id = library.register_user("Late")
+        assert library.borrow_book(user_id, "ISBN0")  # 只在日志中
+        assert library.borrow_book(user_id, "ISBN2")  # 同时在快照中
+        yield from records
+
+    monkeypatch.setattr(library, '_snapshot_records', _interleaved)
+    storage.snapshot()
+    library.detach_storage()
+
+    recovered = _recover(library_module, tmp_path)
+    try:
+        recovered.check_invariants()
+        assert sorted(recovered._users["USER0002"].borrowed_books) == ["ISBN0", "ISBN2"]
+        assert set(recovered._books["ISBN0"].borrowed_by) == {"USER0001", "USER0002"}
+    finally:
+        recovered.detach_storage()
+
+
+def test_load_snapshot_tolerates_loan_of_missing_user(library):
+    library._load_snapshot(iter([{
+        'type': 'book', 'title': 'Book', 'author': ['Author', 1970, 'Unknown'],
+        'isbn': 'ISBN0', 'copies': 2, 'borrowed_by': {'USER0002': '2024-01-01T00:00:00'},
+    }]))
+    assert set(library._books['ISBN0'].borrowed_by) == {'USER0002'}
+
+
+def test_register_is_logged_before_user_can_borrow(library_module, library, tmp_path):
+    storage = library_module.LibraryStorage(tmp_path, snapshot_every=None)
+    library.attach_storage(storage)
+    _add_books(library_module, library, 1)
+    append = storage.append
+
+    def _append(record, *args, **kwargs):
+        if record['op'] == 'register_user':
+            # 模拟另一个线程在注册记录写入日志之前就用新ID借书
+            library.borrow_book(record['user_id'], "ISBN0")
+        append(record, *args, **kwargs)
+
+    storage.append = _append
+    library.register_user("Racer")
+    storage.append = append
+    library.detach_storage()
+
+    recovered = _recover(library_module, tmp_path)
+    try:
+        recovered.check_invariants()
+    finally:
+        recovered.detach_storage()
+
+
+def test_bulk_import_with_repeated_isbns_keeps_title_index_exact(library_module, library, tmp_path):
+    import csv
+    import random
+
+    rng = random.Random(0)
+    _add_books(library_module, library, 20)
+    path = tmp_path / 'books.csv'
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['title', 'author', 'birth_year', 'nationality', 'isbn', 'copies'])
+        for i in range(300):
+            writer.writerow([f"{rng.choice('ABCXYZ')} title {i}", 'Author', 1970, 'Unknown',
+                             f"ISBN{rng.randrange(40)}", 1])
+
+    library.bulk_import_books(str(path))
+    expected = sorted((book.title.casefold(), book.isbn) for book in library._books.values())
+    assert library._title_index == expected
+    for book in library.search_by_title_prefix('x'):
+        assert book.title.startswith('X')
+
+
+def test_borrow_batch_rejects_user_registered_after_lock_set_is_built(library_module, library):
+    _add_books(library_module, library, 1)
+    hold = library._user_locks.hold
+
+    def _hold(keys):
+        # 在锁集合确定之后注册请求中的用户
+        keys = list(keys)
+        library.register_user("Late")
+        return hold(keys)
+
+    library._user_locks.hold = _hold
+    assert library.borrow_batch([("USER0001", "ISBN0")]) == [False]
+    assert library._users["USER0001"].borrowed_books == []
+    assert library.borrow_batch([("USER0001", "ISBN0")]) == [True]
+    library.check_invariants()
+
+
+def test_snapshot_right_after_register_record_keeps_user(library_module, library, tmp_path):
+    storage = library_module.LibraryStorage(tmp_path, snapshot_every=None)
+    library.attach_storage(storage)
+    _add_books(library_module, library, 1)
+    append = storage.append
+
+    def _append(record, *args, **kwargs):
+        append(record, *args, **kwargs)
+        if record['op'] == 'register_user':
+            # 模拟注册记录写入后立即有快照切换日志段
+            storage.snapshot()
+
+    storage.append = _append
+    user_id = library.register_user("Snapshotted")
+    storage.append = append
+    assert library.borrow_book(user_id, "ISBN0")
+    library.detach_storage()
+
+    recovered = _recover(library_module, tmp_path)
+    try:
+        recovered.check_invariants()
+        assert recovered._users[user_id].borrowed_books == ["ISBN0"]
+        assert recovered.register_user("Next") != user_id
+    finally:
+        recovered.detach_storage()
+
+
+def test_records_after_torn_first_record_survive_second_recovery(library_module, library, tmp_path):
+    storage = library_module.LibraryStorage(tmp_path, snapshot_every=None)
+    library.attach_storage(storage)
+    _add_books(library_module, library, 1)
+    storage.snapshot()  # 之后的记录写入新的日志段
+    library.detach_storage()
+    segment = storage._segments('wal')[-1][1]
+    segment.write_text('{"op": "add_bo', encoding='utf-8')  # 崩溃时第一条记录只写了一半
+
+    recovered = _recover(library_module, tmp_path)
+    author = library_module.Author("Author", 1970, "Unknown")
+    recovered.add_book(library_module.Book("Later", author, "ISBN9", 1))
+    user_id = recovered.register_user("Later")
+    assert recovered.borrow_book(user_id, "ISBN9")
+    recovered.detach_storage()
+
+    again = _recover(library_module, tmp_path)
+    try:
+        again.check_invariants()
+        assert set(again._books) == {"ISBN0", "ISBN9"}
+        assert again._users[user_id].borrowed_books == ["ISBN9"]
+    finally:
+        again.detach_storage()
+
+
+def test_crash_before_bulk_import_snapshot_keeps_imported_data(library_module, library, tmp_path, monkeypatch):
+    storage = library_module.LibraryStorage(tmp_path / 'wal', snapshot_every=None)
+    library.attach_storage(storage)
+    _add_books(library_module, library, 1)
+    reader = library.register_user("Reader")
+    books_path = tmp_path / 'books.csv'
+    books_path.write_text('title,author,birth_year,nationality,isbn,copies\n'
+                          + ''.join(f'Imported {i},Author,1970,Unknown,IMP{i},1\n' for i in range(5)),
+                          encoding='utf-8')
+    users_path = tmp_path / 'users.jsonl'
+    users_path.write_text('{"name": "Imported 0"}\n{"name": "Imported 1"}\n', encoding='utf-8')
+
+    # 导入后的快照还没完成时，已有其他请求借走了导入的图书，随后进程崩溃
+    monkeypatch.setattr(storage, 'snapshot', lambda: library.borrow_book(reader, "IMP3"))
+    assert library.bulk_import_books(str(books_path), chunk_size=2) == 5
+    monkeypatch.setattr(storage, 'snapshot', lambda: library.borrow_book("USER0003", "ISBN0"))
+    assert library.bulk_import_users(str(users_path)) == ["USER0002", "USER0003"]
+    library.detach_storage()
+
+    recovered = _recover(library_module, tmp_path / 'wal')
+    try:
+        recovered.check_invariants()
+        assert {f"IMP{i}" for i in range(5)} <= set(recovered._books)
+        assert recovered._users[reader].borrowed_books == ["IMP3"]
+        assert recovered._users["USER0003"].borrowed_books == ["ISBN0"]
+        assert recovered.register_user("Next") == "USER0004"
+    finally:
+        recovered.detach_storage()
+
+
+def test_concurrent_snapshots_are_serialized(library_module, library, tmp_path, monkeypatch):
+    import threading
+    import time
+
+    storage = library_module.LibraryStorage(tmp_path, snapshot_every=None)
+    library.attach_storage(storage)
+    _add_books(library_module, library, 3)
+    library.borrow_book(library.register_user("Reader"), "ISBN1")
+    export = library._snapshot_records
+
+    def _slow_export():
+        for record in export():
+            time.sleep(0.01)  # 拉长导出时间，让两个快照重叠
+            yield record
+
+    monkeypatch.setattr(library, '_snapshot_records', _slow_export)
+    errors = []
+
+    def _snapshot():
+        try:
+            storage.snapshot()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=_snapshot) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    library.detach_storage()
+
+    recovered = _recover(library_module, tmp_path)
+    try:
+        recovered.check_invariants()
+        assert set(recovered._books) == {"ISBN0", "ISBN1", "ISBN2"}
+        assert recovered._users["USER0001"].borrowed_books == ["ISBN1"]
+    finally:
+        recovered.detach_storage()
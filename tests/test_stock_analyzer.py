@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+
+def _analyzer(module, n_symbols=3, n_days=100, seed=0):
+    source = module.SyntheticDataSource(n_symbols, n_days, seed)
+    analyzer = module.StockAnalyzer(source=source)
+    dates = source.frames[module.StockAnalyzer.market_symbol].index
+    analyzer.fetch_data(source.symbols, dates[0].strftime('%Y-%m-%d'),
+                        (dates[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+    return analyzer, source.symbols
+
+
+def test_rolling_max_matches_pandas(analyzer_module):
+    values = np.random.default_rng(0).normal(size=(50, 3))
+    for window in (1, 7, 26, 49, 50, 51, 80):
+        expected = pd.DataFrame(values).rolling(window, min_periods=1).max().to_numpy()
+        np.testing.assert_allclose(analyzer_module._rolling_max(values, window), expected)
+
+
+def test_rolling_metrics_with_history_shorter_than_window(analyzer_module):
+    analyzer, symbols = _analyzer(analyzer_module, n_days=100)
+    results = analyzer.rolling_metrics(symbols, windows=(60, 120, 252))
+    assert set(results) == {60, 120, 252}
+    assert results[60]['drawdown'].notna().any().any()
+    # 有效数据不足窗口长度，结果全部为 NaN
+    assert results[252]['volatility'].isna().all().all()
+
+
+def test_batch_metrics_without_market_data_logs_and_returns_empty(analyzer_module):
+    analyzer, symbols = _analyzer(analyzer_module)
+    analyzer._set_market_data(None)
+    assert analyzer.calculate_metrics_batch(symbols) == {}
+    assert analyzer.generate_report(symbols).empty
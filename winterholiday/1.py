@@ -1,9 +1,10 @@
 import pygame
 import time
 import random
-
-# 初始化pygame
-pygame.init()
+import os
+import argparse
+from collections import deque
+import numpy as np
 
 # 定义颜色
 white = (255, 255, 255)
@@ -17,32 +18,406 @@ blue = (50, 153, 213)
 dis_width = 800
 dis_height = 600
 
-# 创建游戏窗口
-dis = pygame.display.set_mode((dis_width, dis_height))
-pygame.display.set_caption('贪吃蛇游戏')
-
-# 定义时钟
-clock = pygame.time.Clock()
-
 # 定义蛇的大小和速度
 snake_block = 10
 snake_speed = 15
 
+# 棋盘按格子计算，蛇身和食物都用 (列, 行) 表示
+grid_cols = dis_width // snake_block
+grid_rows = dis_height // snake_block
+
 # 加载支持中文的字体文件（确保字体文件路径正确）
 font_path = "C:/Windows/Fonts/simsun.ttc"# 例如宋体字体文件
-font_style = pygame.font.Font(font_path, 25)
-score_font = pygame.font.Font(font_path, 35)
+
+# 窗口、时钟和字体在 init_display 中创建，导入本模块时不会打开窗口
+dis = None
+clock = None
+font_style = None
+score_font = None
+
+
+def init_display():
+    global dis, clock, font_style, score_font
+    # 初始化pygame
+    pygame.init()
+    # 创建游戏窗口
+    dis = pygame.display.set_mode((dis_width, dis_height))
+    pygame.display.set_caption('贪吃蛇游戏')
+    # 定义时钟
+    clock = pygame.time.Clock()
+    # 找不到字体文件时使用 pygame 默认字体
+    path = font_path if os.path.exists(font_path) else None
+    font_style = pygame.font.Font(path, 25)
+    score_font = pygame.font.Font(path, 35)
+
+
+class Snake:
+    """
+    蛇身：deque 按从尾到头的顺序保存格子，set 记录被占用的格子，
+    移动、增长和碰撞检测每帧都是 O(1)
+    """
+
+    def __init__(self, head):
+        self.body = deque([head])
+        self.occupied = {head}
+
+    @property
+    def head(self):
+        return self.body[-1]
+
+    def __len__(self):
+        return len(self.body)
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def move(self, cell, length):
+        """
+        头部移动到 cell，蛇身超过 length 时去掉尾部；
+        返回 (是否撞到自己, 被腾出的尾部格子或 None)。
+        尾部先移走，所以头部可以进入尾部刚离开的格子
+        """
+        vacated = None
+        if len(self.body) >= length:
+            vacated = self.body.popleft()
+            self.occupied.discard(vacated)
+        collided = cell in self.occupied
+        self.body.append(cell)
+        self.occupied.add(cell)
+        return collided, vacated
+
+
+class FreeCells:
+    """
+    空闲格子集合：列表保存格子，字典记录每个格子在列表中的位置，
+    删除时把最后一个元素换到被删除的位置，加入、删除和均匀随机抽取都是 O(1)
+    """
+
+    def __init__(self, cells):
+        self.cells = list(cells)
+        self.index = {cell: i for i, cell in enumerate(self.cells)}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return cell in self.index
+
+    def add(self, cell):
+        self.index[cell] = len(self.cells)
+        self.cells.append(cell)
+
+    def remove(self, cell):
+        i = self.index.pop(cell)
+        last = self.cells.pop()
+        if last != cell:
+            self.cells[i] = last
+            self.index[last] = i
+
+    def sample(self, rng):
+        return self.cells[rng.randrange(len(self.cells))]
+
+
+# 方向编号，step 的动作参数使用这些编号
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+
+class SnakeGame:
+    """
+    不依赖 pygame 的游戏逻辑（撞墙、撞到自己、吃到食物变长），gameLoop 也使用这套规则；
+    step 每次前进一格，direction 为 UP/DOWN/LEFT/RIGHT，None 表示保持当前方向（开局时蛇不动）。
+    食物只会出现在蛇身以外的格子上，蛇占满整个棋盘时游戏胜利结束
+    """
+
+    def __init__(self, cols=grid_cols, rows=grid_rows, seed=None):
+        self.cols = cols
+        self.rows = rows
+        self.rng = random.Random(seed)
+        self.reset()
+
+    def reset(self):
+        head = (self.cols // 2, self.rows // 2)
+        self.snake = Snake(head)
+        self.free = FreeCells((x, y) for y in range(self.rows) for x in range(self.cols))
+        self.free.remove(head)
+        self.length = 1
+        self.direction = (0, 0)
+        self.food = self._spawn_food()
+        self.vacated = None  # 上一步腾出的蛇尾格子，供渲染使用
+        self.done = False
+
+    @property
+    def score(self):
+        return self.length - 1
+
+    def _spawn_food(self):
+        """在空闲格子中均匀抽取食物位置，没有空闲格子时返回 None"""
+        return self.free.sample(self.rng) if self.free else None
+
+    def step(self, direction=None):
+        """前进一步，返回 (奖励, 是否结束)：吃到食物奖励 1（占满棋盘时同时结束），死亡奖励 -1"""
+        if self.done:
+            raise RuntimeError("Game is over, call reset() first")
+        if direction is not None:
+            self.direction = DIRECTIONS[direction]
+        x, y = self.snake.head
+        x += self.direction[0]
+        y += self.direction[1]
+        self.vacated = None
+        if x >= self.cols or x < 0 or y >= self.rows or y < 0:
+            self.done = True
+            return -1, True
+
+        collided, self.vacated = self.snake.move((x, y), self.length)
+        if collided:
+            self.done = True
+            return -1, True
+        if self.vacated is not None:
+            self.free.add(self.vacated)
+        self.free.remove((x, y))
+        if (x, y) == self.food:
+            self.length += 1
+            self.food = self._spawn_food()
+            self.done = self.food is None
+            return 1, self.done
+        return 0, False
+
+
+_DX = np.array([dx for dx, _ in DIRECTIONS], dtype=np.int32)
+_DY = np.array([dy for _, dy in DIRECTIONS], dtype=np.int32)
+
+
+class SnakeBatch:
+    """
+    用 NumPy 同时推进大量互相独立的游戏，规则与 SnakeGame 相同。
+    每个格子记录蛇头到达它时的步数，到达步数在最近 body_length 步以内的格子就是蛇身，
+    所以移动、增长和碰撞检测都是对整批游戏的数组运算；trail 按步数环形记录蛇头经过的格子，用来找到蛇尾。
+    每局的空闲格子用 free_cells/free_pos 两个数组维护（与 FreeCells 相同的交换删除），
+    食物在空闲格子中 O(1) 均匀抽取。结束的游戏在同一步内自动重新开始
+    """
+    EMPTY = -(1 << 30)
+
+    def __init__(self, n_games, cols=grid_cols, rows=grid_rows, seed=None):
+        self.n_games = n_games
+        self.cols = cols
+        self.rows = rows
+        self.rng = np.random.default_rng(seed)
+        self._games = np.arange(n_games)
+        n_cells = cols * rows
+        self.arrival = np.empty((n_games, n_cells), dtype=np.int32)
+        self.trail = np.zeros((n_games, n_cells), dtype=np.int32)  # 第 t 步蛇头进入的格子存放在 t % n_cells
+        self.free_cells = np.empty((n_games, n_cells), dtype=np.int32)
+        self.free_pos = np.empty((n_games, n_cells), dtype=np.int32)
+        self.free_count = np.zeros(n_games, dtype=np.int32)
+        self.t = np.zeros(n_games, dtype=np.int32)
+        self.head_x = np.zeros(n_games, dtype=np.int32)
+        self.head_y = np.zeros(n_games, dtype=np.int32)
+        self.dx = np.zeros(n_games, dtype=np.int32)
+        self.dy = np.zeros(n_games, dtype=np.int32)
+        self.length = np.zeros(n_games, dtype=np.int32)  # 目标长度，吃到食物加一
+        self.body_length = np.zeros(n_games, dtype=np.int32)  # 当前实际长度
+        self.food = np.zeros(n_games, dtype=np.int64)  # 食物所在格子的一维编号 y * cols + x
+        # 二维数组的一维视图，用 游戏编号 * n_cells + 格子 索引比二维花式索引快
+        self._base = self._games * n_cells
+        self._arrival = self.arrival.reshape(-1)
+        self._trail = self.trail.reshape(-1)
+        self._free_cells = self.free_cells.reshape(-1)
+        self._free_pos = self.free_pos.reshape(-1)
+        self.reset()
+
+    def reset(self, mask=None):
+        """重新开始全部游戏，或 mask 为 True 的那些游戏"""
+        games = self._games if mask is None else np.flatnonzero(mask)
+        if games.size == 0:
+            return
+        n_cells = self.cols * self.rows
+        start = (self.rows // 2) * self.cols + self.cols // 2
+        self.arrival[games] = self.EMPTY
+        self.head_x[games] = self.cols // 2
+        self.head_y[games] = self.rows // 2
+        self.arrival[games, start] = 0
+        self.trail[games, 0] = start
+        self.free_cells[games] = np.arange(n_cells, dtype=np.int32)
+        self.free_pos[games] = np.arange(n_cells, dtype=np.int32)
+        self.free_count[games] = n_cells
+        self._remove_free(games, np.full(games.size, start))
+        self.t[games] = 0
+        self.dx[games] = 0
+        self.dy[games] = 0
+        self.length[games] = 1
+        self.body_length[games] = 1
+        self._spawn_food(games)
+
+    def _add_free(self, games, cells):
+        base = self._base[games]
+        count = self.free_count[games]
+        self._free_cells[base + count] = cells
+        self._free_pos[base + cells] = count
+        self.free_count[games] = count + 1
+
+    def _remove_free(self, games, cells):
+        """交换删除：把每局最后一个空闲格子移到被删除格子的位置"""
+        base = self._base[games]
+        last = self.free_count[games] - 1
+        i = self._free_pos[base + cells]
+        moved = self._free_cells[base + last]
+        self._free_cells[base + i] = moved
+        self._free_pos[base + moved] = i
+        self.free_count[games] = last
+
+    def _spawn_food(self, games):
+        """在空闲格子中均匀抽取食物位置（调用方保证这些游戏还有空闲格子）"""
+        picks = self.rng.integers(0, self.free_count[games])
+        self.food[games] = self._free_cells[self._base[games] + picks]
+
+    @property
+    def score(self):
+        return self.length - 1
+
+    def occupancy(self):
+        """每局游戏的蛇身占用情况，形状为 (n_games, rows, cols)"""
+        occupied = self.arrival > (self.t - self.body_length)[:, None]
+        return occupied.reshape(self.n_games, self.rows, self.cols)
+
+    def step(self, actions=None):
+        """
+        所有游戏各前进一步，actions 为每局的方向编号，-1 表示保持当前方向；
+        返回 (奖励, 是否结束) 两个数组，含义与 SnakeGame.step 相同
+        """
+        if actions is not None:
+            actions = np.asarray(actions)
+            turn = actions >= 0
+            self.dx[turn] = _DX[actions[turn]]
+            self.dy[turn] = _DY[actions[turn]]
+        x = self.head_x + self.dx
+        y = self.head_y + self.dy
+        t = self.t + 1
+        inside = (x >= 0) & (x < self.cols) & (y >= 0) & (y < self.rows)
+        cell = np.where(inside, y * self.cols + x, 0)
+
+        # 蛇身达到目标长度时尾部先移走，与 Snake.move 一致
+        popping = self.body_length >= self.length
+        threshold = t - self.body_length - ~popping
+        collided = inside & (self._arrival[self._base + cell] > threshold)
+        dead = ~inside | collided
+        alive = ~dead
+
+        n_cells = self.cols * self.rows
+        games = self._games[alive]
+        head = cell[alive]
+        moved_on = popping[alive]
+        # 先放回腾出的蛇尾，再占用新的蛇头（蛇头可以进入蛇尾刚离开的格子）
+        tail_games = games[moved_on]
+        tails = self._trail[self._base[tail_games] + (t[tail_games] - self.body_length[tail_games]) % n_cells]
+        self._add_free(tail_games, tails)
+        self._remove_free(games, head)
+        t_alive = t[alive]
+        self._arrival[self._base[games] + head] = t_alive
+        self._trail[self._base[games] + t_alive % n_cells] = head
+        self.head_x = np.where(alive, x, self.head_x)
+        self.head_y = np.where(alive, y, self.head_y)
+        self.t = t
+        self.body_length += alive & ~popping
+
+        ate = alive & (cell == self.food)
+        self.length += ate
+        won = ate & (self.free_count == 0)
+        self._spawn_food(np.flatnonzero(ate & ~won))
+
+        rewards = ate.astype(np.float32) - dead
+        done = dead | won
+        self.reset(done)
+        return rewards, done
+
+
+def benchmark_batch(n_games=4096, n_steps=1000, cols=20, rows=20, seed=0):
+    """随机动作下的批量模拟速度，返回每秒推进的游戏步数"""
+    batch = SnakeBatch(n_games, cols, rows, seed)
+    rng = np.random.default_rng(seed + 1)
+    actions = rng.integers(-1, 4, size=(64, n_games))
+    start = time.perf_counter()
+    episodes = 0
+    for i in range(n_steps):
+        _, dones = batch.step(actions[i % 64])
+        episodes += int(dones.sum())
+    elapsed = time.perf_counter() - start
+    steps_per_second = n_games * n_steps / elapsed
+    print(f"{n_games} games x {n_steps} steps on {cols}x{rows}: "
+          f"{steps_per_second:,.0f} steps/s, {episodes} episodes finished")
+    return steps_per_second
+
+
+def cell_rect(cell):
+    return [cell[0] * snake_block, cell[1] * snake_block, snake_block, snake_block]
+
+
+class DirtyRenderer:
+    """
+    增量渲染：每帧只重画发生变化的格子（新的蛇头、腾出的蛇尾、食物），
+    只把这些区域传给 display.update；得分文字按分值缓存渲染结果
+    """
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.dirty = []
+        self._score_surfaces = {}
+        self._score_rect = pygame.Rect(0, 0, 0, 0)
+
+    def score_surface(self, score):
+        value = self._score_surfaces.get(score)
+        if value is None:
+            value = score_font.render("你的得分: " + str(score), True, yellow)
+            self._score_surfaces[score] = value
+        return value
+
+    def full_redraw(self, snake, food, score):
+        """重画整个窗口（开始或重新开始时）"""
+        self.surface.fill(blue)
+        pygame.draw.rect(self.surface, green, cell_rect(food))
+        for cell in snake:
+            pygame.draw.rect(self.surface, black, cell_rect(cell))
+        self._score_rect = self.surface.blit(self.score_surface(score), [0, 0])
+        self.dirty = [self.surface.get_rect()]
+
+    def _draw_cell(self, cell, color):
+        self.dirty.append(pygame.draw.rect(self.surface, color, cell_rect(cell)))
+
+    def _redraw_score_area(self, snake, food, score):
+        """重画得分文字覆盖的区域：先画背景和其中的格子，再把文字画在最上层"""
+        value = self.score_surface(score)
+        area = self._score_rect.union(value.get_rect())
+        self.surface.fill(blue, area)
+        for col in range(area.left // snake_block, min(grid_cols, area.right // snake_block + 1)):
+            for row in range(area.top // snake_block, min(grid_rows, area.bottom // snake_block + 1)):
+                cell = (col, row)
+                if cell in snake.occupied:
+                    pygame.draw.rect(self.surface, black, cell_rect(cell))
+                elif cell == food:
+                    pygame.draw.rect(self.surface, green, cell_rect(cell))
+        self._score_rect = self.surface.blit(value, [0, 0])
+        self.dirty.append(area)
+
+    def update(self, snake, vacated, food, food_moved, score, score_changed):
+        """根据本帧的变化画出蛇头、擦掉蛇尾、画出新食物"""
+        if vacated is not None and vacated not in snake.occupied:
+            self._draw_cell(vacated, green if vacated == food else blue)
+        if food_moved and food not in snake.occupied:
+            self._draw_cell(food, green)
+        self._draw_cell(snake.head, black)
+        if score_changed or self._score_rect.collidelist(self.dirty) != -1:
+            self._redraw_score_area(snake, food, score)
+
+    def flush(self):
+        pygame.display.update(self.dirty)
+        self.dirty = []
+
 
 # 显示得分
 def Your_score(score):
     value = score_font.render("你的得分: " + str(score), True, yellow)
     dis.blit(value, [0, 0])
 
-# 绘制蛇
-def our_snake(snake_block, snake_list):
-    for x in snake_list:
-        pygame.draw.rect(dis, black, [x[0], x[1], snake_block, snake_block])
-
 # 显示消息
 def message(msg, color):
     mesg = font_style.render(msg, True, color)
@@ -53,24 +428,18 @@ def gameLoop():
     game_over = False
     game_close = False
 
-    x1 = dis_width / 2
-    y1 = dis_height / 2
-
-    x1_change = 0
-    y1_change = 0
-
-    snake_List = []
-    Length_of_snake = 1
+    game = SnakeGame()
 
-    foodx = round(random.randrange(0, dis_width - snake_block) / 10.0) * 10.0
-    foody = round(random.randrange(0, dis_height - snake_block) / 10.0) * 10.0
+    renderer = DirtyRenderer(dis)
+    renderer.full_redraw(game.snake, game.food, 0)
+    renderer.flush()
 
     while not game_over:
 
         while game_close == True:
             dis.fill(blue)
             message("你输了! 按Q退出或C重新开始", red)
-            Your_score(Length_of_snake - 1)
+            Your_score(game.score)
             pygame.display.update()
 
             for event in pygame.event.get():
@@ -80,55 +449,50 @@ def gameLoop():
                         game_close = False
                     if event.key == pygame.K_c:
                         gameLoop()
+        if game_over:
+            break
 
+        direction = None
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 game_over = True
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_LEFT:
-                    x1_change = -snake_block
-                    y1_change = 0
+                    direction = LEFT
                 elif event.key == pygame.K_RIGHT:
-                    x1_change = snake_block
-                    y1_change = 0
+                    direction = RIGHT
                 elif event.key == pygame.K_UP:
-                    y1_change = -snake_block
-                    x1_change = 0
+                    direction = UP
                 elif event.key == pygame.K_DOWN:
-                    y1_change = snake_block
-                    x1_change = 0
-
-        if x1 >= dis_width or x1 < 0 or y1 >= dis_height or y1 < 0:
-            game_close = True
-        x1 += x1_change
-        y1 += y1_change
-        dis.fill(blue)
-        pygame.draw.rect(dis, green, [foodx, foody, snake_block, snake_block])
-        snake_Head = []
-        snake_Head.append(x1)
-        snake_Head.append(y1)
-        snake_List.append(snake_Head)
-        if len(snake_List) > Length_of_snake:
-            del snake_List[0]
-
-        for x in snake_List[:-1]:
-            if x == snake_Head:
-                game_close = True
-
-        our_snake(snake_block, snake_List)
-        Your_score(Length_of_snake - 1)
-
-        pygame.display.update()
-
-        if x1 == foodx and y1 == foody:
-            foodx = round(random.randrange(0, dis_width - snake_block) / 10.0) * 10.0
-            foody = round(random.randrange(0, dis_height - snake_block) / 10.0) * 10.0
-            Length_of_snake += 1
+                    direction = DOWN
+
+        reward, game_close = game.step(direction)
+        if game_close:
+            continue
+
+        # 吃到食物时已经换了位置，本帧就画出新食物和新得分
+        ate = reward > 0
+        renderer.update(game.snake, game.vacated, game.food, ate, game.score, ate)
+        renderer.flush()
 
         clock.tick(snake_speed)
 
     pygame.quit()
     quit()
 
-# 启动游戏
-gameLoop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='贪吃蛇游戏')
+    parser.add_argument('--benchmark', action='store_true', help='不打开窗口，运行批量模拟的速度测试')
+    parser.add_argument('--games', type=int, default=4096, help='同时模拟的游戏数量')
+    parser.add_argument('--steps', type=int, default=1000, help='模拟的步数')
+    parser.add_argument('--size', type=int, nargs=2, default=[20, 20], metavar=('COLS', 'ROWS'),
+                        help='模拟使用的棋盘大小')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_batch(args.games, args.steps, *args.size)
+    else:
+        init_display()
+        # 启动游戏
+        gameLoop()
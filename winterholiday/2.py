@@ -1,7 +1,26 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Set, Tuple, Iterable, Iterator, Mapping, Callable
 from datetime import datetime, timedelta
 from abc import ABC, abstractmethod
+from pathlib import Path
+from types import MappingProxyType
+from contextlib import contextmanager, ExitStack
+from collections import deque
+import asyncio
+import atexit
+import csv
 import json
+import os
+import platform
+import tracemalloc
+import bisect
+import heapq
+import itertools
+import random
+import threading
+import time
+import zlib
+import argparse
+import multiprocessing
 from dataclasses import dataclass
 import logging
 
@@ -13,16 +32,131 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+class AuditLog:
+    """
+    审计事件管道：业务代码只把事件元组追加到环形缓冲区（deque 的 append 本身是线程安全的），
+    后台线程按批取出事件，再格式化消息、写入 JSON Lines 文件或转发给 logger；
+    消息模板只在后台线程里、并且确实需要输出时才格式化。
+    计数器（借出、拒绝、超出借阅上限等）按线程分别累加，不需要加锁，读取时汇总，不必解析日志
+    """
+
+    def __init__(self, capacity: int = 65536, batch_size: int = 1024, flush_interval: float = 0.1,
+                 sink: Optional[str] = None, forward_to_logger: bool = True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sink = sink
+        self.forward_to_logger = forward_to_logger
+        # 缓冲区满时丢弃最旧的事件，请求路径永远不会因为审计而阻塞
+        self._buffer: deque = deque(maxlen=capacity)
+        self._local = threading.local()
+        self._thread_counts: List[Dict[str, int]] = []  # 每个线程一份计数字典，只由所属线程写入
+        self._counts_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def record(self, kind: str, template: str, level: int = logging.INFO, **fields) -> None:
+        """记录一个事件，template 使用 str.format 占位符，由 fields 填充"""
+        try:
+            counts = self._local.counts
+        except AttributeError:
+            counts = self._local.counts = {}
+            with self._counts_lock:
+                self._thread_counts.append(counts)
+        counts[kind] = counts.get(kind, 0) + 1
+        # 没有任何输出目标需要这个事件时只计数
+        if self.sink is None and not (self.forward_to_logger and logger.isEnabledFor(level)):
+            return
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            counts['dropped'] = counts.get('dropped', 0) + 1
+        if self._thread is None:
+            self._start()
+        buffer.append((time.time(), kind, level, template, fields))
+        if len(buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def counters(self) -> Dict[str, int]:
+        """各类事件的累计次数，以及因缓冲区溢出丢弃的事件数（并发时为近似值）"""
+        totals = {'dropped': 0}
+        with self._counts_lock:
+            thread_counts = list(self._thread_counts)
+        for counts in thread_counts:
+            for kind, count in list(counts.items()):
+                totals[kind] = totals.get(kind, 0) + count
+        return totals
+
+    def reset_counters(self) -> None:
+        """清零计数器（应在没有并发记录时调用）"""
+        with self._counts_lock:
+            for counts in self._thread_counts:
+                counts.clear()
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """取出缓冲区中的全部事件并按批输出"""
+        with self._drain_lock:
+            while self._buffer:
+                batch = []
+                try:
+                    while len(batch) < self.batch_size:
+                        batch.append(self._buffer.popleft())
+                except IndexError:
+                    pass
+                self._write_batch(batch)
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        if self.sink is not None:
+            lines = [json.dumps({'ts': ts, 'event': kind, **fields}, default=str) + '\n'
+                     for ts, kind, _, _, fields in batch]
+            with open(self.sink, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+        if self.forward_to_logger:
+            for _, _, level, template, fields in batch:
+                if logger.isEnabledFor(level):
+                    logger.log(level, template.format(**fields))
+
+    def close(self) -> None:
+        """停止后台线程并输出剩余事件"""
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+audit_log = AuditLog()
+atexit.register(audit_log.close)
+
+
+@dataclass(frozen=True, slots=True)
 class Author:
-    """作者信息数据类"""
+    """作者信息数据类（不可变，可以在多本书之间共享同一个对象）"""
     name: str
     birth_year: int
     nationality: str
 
 
+_NO_LOANS: Mapping[str, datetime] = MappingProxyType({})
+
+
 class Book:
     """图书类，使用属性装饰器和私有属性示范"""
+    # 使用 __slots__ 去掉每个实例的 __dict__；借阅记录字典在第一次借出时才创建
+    __slots__ = ('_title', '_author', '_isbn', '_total_copies', '_available_copies', '_borrowed_by')
 
     def __init__(self, title: str, author: Author, isbn: str, total_copies: int):
         self._title = title
@@ -30,24 +164,49 @@ class Book:
         self._isbn = isbn
         self._total_copies = total_copies
         self._available_copies = total_copies
-        self._borrowed_by: Dict[str, datetime] = {}
+        self._borrowed_by: Optional[Dict[str, datetime]] = None
 
     @property
     def title(self) -> str:
         return self._title
 
+    @property
+    def author(self) -> Author:
+        return self._author
+
+    @property
+    def isbn(self) -> str:
+        return self._isbn
+
+    @property
+    def total_copies(self) -> int:
+        return self._total_copies
+
     @property
     def available_copies(self) -> int:
         return self._available_copies
 
+    @property
+    def borrowed_by(self) -> Mapping[str, datetime]:
+        """借阅记录：user_id -> 借出时间"""
+        return self._borrowed_by if self._borrowed_by is not None else _NO_LOANS
+
+    def _add_loan(self, user_id: str, borrowed_at: datetime) -> None:
+        if self._borrowed_by is None:
+            self._borrowed_by = {}
+        self._borrowed_by[user_id] = borrowed_at
+        self._available_copies -= 1
+
     def borrow_book(self, user_id: str) -> bool:
         """借书方法，展示异常处理"""
         try:
-            if self._available_copies > 0 and user_id not in self._borrowed_by:
-                self._available_copies -= 1
-                self._borrowed_by[user_id] = datetime.now()
-                logger.info(f"Book '{self._title}' borrowed by user {user_id}")
+            if self._available_copies > 0 and user_id not in self.borrowed_by:
+                self._add_loan(user_id, datetime.now())
+                audit_log.record('borrow', "Book '{title}' borrowed by user {user_id}",
+                                 title=self._title, user_id=user_id, isbn=self._isbn)
                 return True
+            audit_log.record('rejected', "Book '{title}' not available for user {user_id}", logging.DEBUG,
+                             title=self._title, user_id=user_id, isbn=self._isbn)
             return False
         except Exception as e:
             logger.error(f"Error borrowing book: {str(e)}")
@@ -56,6 +215,7 @@ class Book:
 
 class LibraryUser:
     """图书馆用户类，展示类方法和实例方法"""
+    __slots__ = ('user_id', 'name', 'borrowed_books')
     _total_users = 0  # 类变量示例
 
     def __init__(self, user_id: str, name: str):
@@ -70,49 +230,1347 @@ class LibraryUser:
         return cls._total_users
 
 
+class LockStripes:
+    """分段锁：按键的哈希值映射到固定数量的锁，避免为每个对象单独创建锁"""
+
+    def __init__(self, count: int = 64):
+        self._locks = [threading.Lock() for _ in range(count)]
+
+    def index(self, key: str) -> int:
+        return hash(key) % len(self._locks)
+
+    def lock_for(self, key: str) -> threading.Lock:
+        return self._locks[self.index(key)]
+
+    @contextmanager
+    def hold(self, keys: Iterable[str]):
+        """一次性按编号顺序获取多个键对应的锁（去重，避免同一把锁重复获取）"""
+        with ExitStack() as stack:
+            for index in sorted({self.index(key) for key in keys}):
+                stack.enter_context(self._locks[index])
+            yield
+
+
+class UserIdAllocator:
+    """
+    用户ID分配器：第 shard_id 个分片只分配编号满足 (编号-1) % num_shards == shard_id 的ID，
+    多个进程各自分配也不会冲突，并且可以从ID直接算出用户所在的分片；
+    单分片时依次分配 USER0001, USER0002, ...
+    """
+
+    def __init__(self, shard_id: int = 0, num_shards: int = 1):
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        self._next = 0  # 本分片下一个ID的序号
+        self._lock = threading.Lock()
+
+    def allocate(self) -> str:
+        with self._lock:
+            number = self._next * self.num_shards + self.shard_id + 1
+            self._next += 1
+        return f"USER{number:04d}"
+
+    def advance_past(self, number: int) -> None:
+        """确保之后分配的编号都大于 number（用于数据恢复后）"""
+        with self._lock:
+            self._next = max(self._next, (number - self.shard_id - 1) // self.num_shards + 1)
+
+    @staticmethod
+    def home_shard(user_id: str, num_shards: int) -> int:
+        return (int(user_id[4:]) - 1) % num_shards
+
+
+class LibraryStorage:
+    """
+    持久化存储：每次变更以一行 JSON 追加到预写日志（WAL），按批次或时间间隔 fsync；
+    定期写入紧凑快照并切换到新的日志段，恢复时加载最新快照后只重放快照之后的日志。
+    日志重放是幂等的，快照期间并发写入的记录即使已包含在快照中也可以安全重放
+    """
+
+    def __init__(self, directory: str, fsync_batch: int = 256, fsync_interval: float = 0.05,
+                 snapshot_every: Optional[int] = 1_000_000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every  # 每写入多少条日志自动做一次快照，None 表示不自动快照
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()  # 快照串行执行，同一时间只有一个快照在切换日志段和写文件
+        self._log = None
+        self._lsn = 0  # 最后一条日志的序号
+        self._pending = 0  # 已写入但尚未 fsync 的记录数
+        self._since_snapshot = 0
+        self._snapshotting = False
+        self._closed = threading.Event()
+        self._library: Optional['LibrarySystem'] = None
+
+    def _segments(self, prefix: str) -> List[Tuple[int, Path]]:
+        """按序号排序的快照或日志段文件"""
+        files = []
+        for path in self.directory.glob(f"{prefix}-*"):
+            if path.suffix != '.tmp':
+                files.append((int(path.stem.split('-')[1]), path))
+        return sorted(files)
+
+    def _open_segment(self) -> None:
+        # 每次恢复或快照后都从新的日志段开始写；恢复时已把写了一半的记录截掉，不会接在残缺的行后面
+        self._log = open(self.directory / f"wal-{self._lsn + 1:012d}.log", 'a', encoding='utf-8')
+
+    def _sync_locked(self) -> None:
+        if self._log is not None and self._pending:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._pending = 0
+
+    def _flush_periodically(self) -> None:
+        """后台线程：保证未同步的记录最多等待 fsync_interval 秒"""
+        while not self._closed.wait(self.fsync_interval):
+            with self._lock:
+                self._sync_locked()
+
+    def recover(self, library: 'LibrarySystem') -> None:
+        """加载最新快照并重放之后的日志，然后开始记录新的变更"""
+        snapshots = self._segments('snapshot')
+        snapshot_lsn = 0
+        if snapshots:
+            snapshot_lsn, path = snapshots[-1]
+            with open(path, encoding='utf-8') as f:
+                library._load_snapshot(json.loads(line) for line in f)
+
+        self._lsn = snapshot_lsn
+        for _, path in self._segments('wal'):
+            self._replay_segment(path, library, snapshot_lsn)
+
+        library._restore_user_counter()
+        self._library = library
+        self._open_segment()
+        threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _replay_segment(self, path: Path, library: 'LibrarySystem', snapshot_lsn: int) -> None:
+        """
+        重放一个日志段；崩溃时最后一行可能只写了一半（没有换行符或无法解析），
+        忽略之后的内容并把文件截断到最后一条完整记录，之后追加的记录不会接在残缺的行后面
+        """
+        valid_end = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("missing newline")
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Truncated record in {path.name}, ignoring the rest of the segment")
+                    break
+                if record['lsn'] > snapshot_lsn:
+                    library._apply_record(record)
+                self._lsn = max(self._lsn, record['lsn'])
+                valid_end += len(line)
+        if valid_end < path.stat().st_size:
+            with open(path, 'r+b') as f:
+                f.truncate(valid_end)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def append(self, record: dict, apply: Optional[Callable[[], None]] = None) -> None:
+        """
+        追加一条变更记录，攒够 fsync_batch 条时同步到磁盘；
+        apply 在分配序号后、释放日志锁之前执行，对快照切换日志段来说，写日志和应用变更是同一步
+        """
+        with self._lock:
+            self._lsn += 1
+            record['lsn'] = self._lsn
+            self._log.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if apply is not None:
+                apply()
+            self._pending += 1
+            if self._pending >= self.fsync_batch:
+                self._sync_locked()
+            self._since_snapshot += 1
+            need_snapshot = (self.snapshot_every is not None and not self._snapshotting
+                             and self._since_snapshot >= self.snapshot_every)
+            if need_snapshot:
+                self._snapshotting = True
+        if need_snapshot:
+            threading.Thread(target=self.snapshot, daemon=True).start()
+
+    def sync(self) -> None:
+        """立即把所有已写入的记录同步到磁盘"""
+        with self._lock:
+            self._sync_locked()
+
+    def snapshot(self) -> None:
+        """
+        写入快照：先切换日志段，再导出当前状态，最后删除快照已覆盖的旧文件；
+        自动快照和批量导入后的快照可能同时触发，后到的一个等前一个完成后再执行
+        """
+        with self._snapshot_lock:
+            self._snapshot_locked()
+
+    def _snapshot_locked(self) -> None:
+        with self._lock:
+            self._snapshotting = True
+            self._sync_locked()
+            self._log.close()
+            snapshot_lsn = self._lsn
+            self._since_snapshot = 0
+            self._open_segment()
+
+        try:
+            tmp_path = self.directory / f"snapshot-{snapshot_lsn:012d}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in self._library._snapshot_records():
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.directory / f"snapshot-{snapshot_lsn:012d}.jsonl")
+
+            for lsn, path in self._segments('snapshot'):
+                if lsn < snapshot_lsn:
+                    path.unlink()
+            for start_lsn, path in self._segments('wal'):
+                if start_lsn <= snapshot_lsn:
+                    path.unlink()
+        finally:
+            with self._lock:
+                self._snapshotting = False
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            self._sync_locked()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
 class LibrarySystem:
-    """图书馆系统类，展示单例模式"""
+    """
+    图书馆系统类，展示单例模式
+    并发借书时按固定顺序加锁：先用户分段锁，再图书分段锁，避免死锁
+    """
     _instance = None
+    _instance_lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
+            with cls._instance_lock:
+                # 双重检查，防止多个线程同时创建实例
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._initialized = False
+                    instance._init_lock = threading.Lock()
+                    cls._instance = instance
         return cls._instance
 
+    @classmethod
+    def reset_instance(cls) -> None:
+        """丢弃当前单例，下次创建时得到全新的系统（用于测试和基准测试）"""
+        with cls._instance_lock:
+            cls._instance = None
+
     def __init__(self):
-        if self._initialized:
-            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            self._setup()
+
+    def _setup(self) -> None:
         self._books: Dict[str, Book] = {}  # ISBN -> Book
         self._users: Dict[str, LibraryUser] = {}  # user_id -> User
+        # 二级索引，随数据变化同步维护
+        self._author_index: Dict[str, Set[str]] = {}  # 作者名 -> ISBN集合
+        self._title_index: List[Tuple[str, str]] = []  # 按 (小写标题, ISBN) 排序，用于前缀查询
+        self._available: Set[str] = set()  # 有可借副本的ISBN
+        self._authors: Dict[Author, Author] = {}  # 作者对象驻留表
+        # 到期时间最小堆：(到期时间, user_id, ISBN, 借出时间)
+        # 与图书当前借阅记录不一致的条目视为失效并跳过，失效条目过多时重建
+        self.loan_period = timedelta(days=14)
+        self._due_heap: List[Tuple[datetime, str, str, datetime]] = []
+        self._stale_loans = 0
+        self._due_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._user_locks = LockStripes()
+        self._book_locks = LockStripes()
+        self._user_ids = UserIdAllocator()
+        self._storage: Optional[LibraryStorage] = None
         self._initialized = True
 
+    def attach_storage(self, storage: LibraryStorage) -> None:
+        """从存储中恢复数据，之后的所有变更都会写入预写日志"""
+        storage.recover(self)
+        self._storage = storage
+
+    def detach_storage(self) -> None:
+        """同步并关闭存储"""
+        if self._storage is not None:
+            self._storage.close()
+            self._storage = None
+
+    def _snapshot_records(self):
+        """
+        导出快照记录；用户的借阅列表可由图书的借阅记录推导，不单独保存。
+        快照在后台导出时仍有新的注册和借书，所以先导出图书、再导出用户（用户不会被删除），
+        保证图书借阅记录中出现的用户都已包含在快照中
+        """
+        with self._index_lock:
+            books = list(self._books.values())
+        for book in books:
+            borrowed_by = dict(book.borrowed_by)
+            author = book.author
+            yield {
+                'type': 'book', 'title': book.title,
+                'author': [author.name, author.birth_year, author.nationality],
+                'isbn': book.isbn, 'copies': book.total_copies,
+                'borrowed_by': {user_id: ts.isoformat() for user_id, ts in borrowed_by.items()},
+            }
+        for user in list(self._users.values()):
+            yield {'type': 'user', 'user_id': user.user_id, 'name': user.name}
+
+    def _restore_user_counter(self) -> None:
+        """恢复后让用户ID计数器从已有最大编号之后继续"""
+        numbers = [int(user_id[4:]) for user_id in self._users]
+        self._user_ids.advance_past(max(numbers, default=0))
+
+    def _load_snapshot(self, records) -> None:
+        """从快照记录重建数据"""
+        loans: Dict[str, List[Tuple[datetime, str]]] = {}
+
+        def _books() -> Iterator[Book]:
+            for record in records:
+                if record['type'] == 'user':
+                    self._users[record['user_id']] = LibraryUser(record['user_id'], record['name'])
+                    continue
+                author = self.intern_author(Author(*record['author']))
+                book = Book(record['title'], author, record['isbn'], record['copies'])
+                for user_id, ts in record['borrowed_by'].items():
+                    borrowed_at = datetime.fromisoformat(ts)
+                    book._add_loan(user_id, borrowed_at)
+                    loans.setdefault(user_id, []).append((borrowed_at, book.isbn))
+                yield book
+
+        self._bulk_add_books(_books())
+        for user_id, user_loans in loans.items():
+            # 旧版本的快照先导出用户，可能缺少导出期间注册的用户，由之后的日志补上
+            user = self._users.get(user_id)
+            if user is not None:
+                user.borrowed_books.extend(isbn for _, isbn in sorted(user_loans))
+        self._rebuild_due_heap()
+
+    def intern_author(self, author: Author) -> Author:
+        """返回与 author 相等的共享作者对象，重复的作者只保存一份"""
+        return self._authors.setdefault(author, author)
+
+    def _bulk_add_books(self, books: Iterable[Book], log: bool = False) -> int:
+        """
+        批量加入图书：新的标题条目按 ISBN 暂存（重复的 ISBN 只保留最后一条），
+        被替换图书的旧条目最后一次性过滤掉，再统一排序，导入过程中不对标题索引做二分查找。
+        log=True 时先把这批图书写成一条日志记录，再让它们可见
+        """
+        count = 0
+        pending: Dict[str, str] = {}  # ISBN -> 小写标题
+        replaced: Set[str] = set()
+        with self._index_lock:
+            if log and self._storage is not None:
+                books = list(books)
+                self._storage.append({'op': 'add_books', 'books': [
+                    [book.title, book.author.name, book.author.birth_year, book.author.nationality,
+                     book.isbn, book.total_copies]
+                    for book in books
+                ]})
+            for book in books:
+                old_book = self._books.get(book.isbn)
+                if old_book is not None:
+                    self._unindex_book(old_book, title_index=False)
+                    replaced.add(book.isbn)
+                self._books[book.isbn] = book
+                self._author_index.setdefault(book.author.name, set()).add(book.isbn)
+                pending[book.isbn] = book.title.casefold()
+                if book.available_copies > 0:
+                    self._available.add(book.isbn)
+                count += 1
+            if replaced:
+                self._title_index = [entry for entry in self._title_index if entry[1] not in replaced]
+            self._title_index.extend((title, isbn) for isbn, title in pending.items())
+            self._title_index.sort()
+        return count
+
+    @staticmethod
+    def _read_records(path: str) -> Iterator[dict]:
+        """按扩展名流式读取 CSV 或 JSONL 文件，逐条产出记录"""
+        with open(path, encoding='utf-8', newline='') as f:
+            if Path(path).suffix.lower() == '.csv':
+                yield from csv.DictReader(f)
+            else:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def bulk_import_books(self, path: str, chunk_size: int = 10_000) -> int:
+        """
+        从 CSV 或 JSONL 文件流式导入图书，字段为
+        title, author, birth_year, nationality, isbn, copies；重复的作者只保存一个对象
+        每 chunk_size 本图书写一条紧凑的日志记录后再让它们可见，全部完成后做一次快照压缩日志
+        """
+        def _books() -> Iterator[Book]:
+            for record in self._read_records(path):
+                author = self.intern_author(
+                    Author(record['author'], int(record['birth_year']), record['nationality'])
+                )
+                yield Book(record['title'], author, record['isbn'], int(record['copies']))
+
+        count = 0
+        books = _books()
+        while chunk := list(itertools.islice(books, chunk_size)):
+            count += self._bulk_add_books(chunk, log=True)
+        if self._storage is not None:
+            self._storage.snapshot()
+        return count
+
+    def bulk_import_users(self, path: str, chunk_size: int = 10_000) -> List[str]:
+        """
+        从 CSV 或 JSONL 文件（字段 name）流式导入用户，返回分配的用户ID；
+        与 register_user 一样，每批用户的日志记录写入后才让它们可见
+        """
+        user_ids = []
+        records = self._read_records(path)
+        while chunk := list(itertools.islice(records, chunk_size)):
+            users = [LibraryUser(self._user_ids.allocate(), record['name']) for record in chunk]
+
+            def _insert() -> None:
+                for user in users:
+                    self._users[user.user_id] = user
+
+            if self._storage is not None:
+                self._storage.append({'op': 'register_users',
+                                      'users': [[user.user_id, user.name] for user in users]}, _insert)
+            else:
+                _insert()
+            user_ids.extend(user.user_id for user in users)
+        if self._storage is not None:
+            self._storage.snapshot()
+        return user_ids
+
+    def _apply_record(self, record: dict) -> None:
+        """重放一条日志记录（幂等）"""
+        op = record['op']
+        if op == 'add_book':
+            author = self.intern_author(Author(*record['author']))
+            self.add_book(Book(record['title'], author, record['isbn'], record['copies']))
+        elif op == 'add_books':
+            self._bulk_add_books(
+                Book(title, self.intern_author(Author(name, birth_year, nationality)), isbn, copies)
+                for title, name, birth_year, nationality, isbn, copies in record['books']
+            )
+        elif op == 'register_user':
+            user_id = record['user_id']
+            if user_id not in self._users:
+                self._users[user_id] = LibraryUser(user_id, record['name'])
+        elif op == 'register_users':
+            for user_id, name in record['users']:
+                if user_id not in self._users:
+                    self._users[user_id] = LibraryUser(user_id, name)
+        elif op == 'borrow':
+            # 分片部署时用户可能注册在其他分片
+            user = self._users.get(record['user_id'])
+            book = self._books[record['isbn']]
+            if record['user_id'] not in book.borrowed_by:
+                borrowed_at = datetime.fromisoformat(record['ts'])
+                book._add_loan(record['user_id'], borrowed_at)
+                self._track_loan(record['user_id'], book.isbn, borrowed_at)
+                if book.available_copies == 0:
+                    self._available.discard(book.isbn)
+            if user is not None and book.isbn not in user.borrowed_books:
+                user.borrowed_books.append(book.isbn)
+
+    def _index_book(self, book: Book) -> None:
+        self._author_index.setdefault(book.author.name, set()).add(book.isbn)
+        bisect.insort(self._title_index, (book.title.casefold(), book.isbn))
+        if book.available_copies > 0:
+            self._available.add(book.isbn)
+
+    def _unindex_book(self, book: Book, title_index: bool = True) -> None:
+        if book.borrowed_by:
+            # 被替换图书的借阅记录在到期堆中失效
+            with self._due_lock:
+                self._stale_loans += len(book.borrowed_by)
+        isbns = self._author_index.get(book.author.name)
+        if isbns is not None:
+            isbns.discard(book.isbn)
+            if not isbns:
+                del self._author_index[book.author.name]
+        if title_index:
+            key = (book.title.casefold(), book.isbn)
+            pos = bisect.bisect_left(self._title_index, key)
+            if pos < len(self._title_index) and self._title_index[pos] == key:
+                del self._title_index[pos]
+        self._available.discard(book.isbn)
+
     def add_book(self, book: Book) -> None:
         """添加图书，展示类型注解"""
-        self._books[book._isbn] = book
+        book._author = self.intern_author(book.author)
+        with self._book_locks.lock_for(book.isbn), self._index_lock:
+            old_book = self._books.get(book.isbn)
+            if old_book is not None:
+                self._unindex_book(old_book)
+            self._books[book.isbn] = book
+            self._index_book(book)
+            if self._storage is not None:
+                author = book.author
+                self._storage.append({
+                    'op': 'add_book', 'title': book.title,
+                    'author': [author.name, author.birth_year, author.nationality],
+                    'isbn': book.isbn, 'copies': book.total_copies,
+                })
+
+    def find_by_author(self, name: str) -> List[Book]:
+        """按作者名查找图书"""
+        with self._index_lock:
+            isbns = list(self._author_index.get(name, ()))
+        return [self._books[isbn] for isbn in isbns]
+
+    def search_by_title_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Book]:
+        """按标题前缀查找图书（不区分大小写），结果按标题排序"""
+        key = prefix.casefold()
+        isbns = []
+        with self._index_lock:
+            pos = bisect.bisect_left(self._title_index, (key,))
+            while pos < len(self._title_index) and (limit is None or len(isbns) < limit):
+                title, isbn = self._title_index[pos]
+                if not title.startswith(key):
+                    break
+                isbns.append(isbn)
+                pos += 1
+        return [self._books[isbn] for isbn in isbns]
+
+    def available_books(self) -> List[Book]:
+        """所有有可借副本的图书"""
+        with self._index_lock:
+            isbns = list(self._available)
+        return [self._books[isbn] for isbn in isbns]
+
+    def search(self, author: Optional[str] = None, title_prefix: Optional[str] = None,
+               available_only: bool = False, limit: Optional[int] = None) -> List[Book]:
+        """组合查询：先用选择性最高的索引取候选集，再用其余条件过滤"""
+        if author is not None:
+            candidates = self.find_by_author(author)
+            if title_prefix is not None:
+                key = title_prefix.casefold()
+                candidates = [book for book in candidates if book.title.casefold().startswith(key)]
+        elif title_prefix is not None:
+            # 需要过滤可借状态时不能提前截断
+            candidates = self.search_by_title_prefix(title_prefix, None if available_only else limit)
+        elif available_only:
+            candidates = self.available_books()
+        else:
+            with self._index_lock:
+                candidates = list(self._books.values())
+
+        if available_only:
+            candidates = [book for book in candidates if book.isbn in self._available]
+        return candidates if limit is None else candidates[:limit]
 
     def register_user(self, name: str) -> str:
-        """注册新用户，展示ID生成"""
-        user_id = f"USER{len(self._users) + 1:04d}"
-        self._users[user_id] = LibraryUser(user_id, name)
+        """注册新用户，展示ID生成（由 UserIdAllocator 分配，并发或多进程注册都不会产生重复ID）"""
+        user_id = self._user_ids.allocate()
+        user = LibraryUser(user_id, name)
+
+        def _insert() -> None:
+            self._users[user_id] = user
+
+        # 在日志锁内写日志并让用户可见：该用户的借书记录总是排在注册记录之后，
+        # 快照要么在注册记录之前切换日志段，要么导出时已能看到这个用户
+        if self._storage is not None:
+            self._storage.append({'op': 'register_user', 'user_id': user_id, 'name': name}, _insert)
+        else:
+            _insert()
         return user_id
 
     def borrow_book(self, user_id: str, isbn: str) -> bool:
         """借书流程，展示复杂业务逻辑处理"""
         if user_id not in self._users or isbn not in self._books:
+            audit_log.record('rejected', "Unknown user {user_id} or book {isbn}", logging.DEBUG,
+                             user_id=user_id, isbn=isbn)
+            return False
+
+        # 固定加锁顺序：用户锁 -> 图书锁，借阅上限检查和副本扣减都在锁内完成
+        with self._user_locks.lock_for(user_id), self._book_locks.lock_for(isbn):
+            user = self._users[user_id]
+            book = self._books[isbn]
+
+            if len(user.borrowed_books) >= 3:  # 最多借3本书
+                audit_log.record('limit_hit', "User {user_id} has reached maximum borrowing limit",
+                                 logging.WARNING, user_id=user_id, isbn=isbn)
+                return False
+
+            if self._borrow_copy_locked(user_id, book):
+                user.borrowed_books.append(isbn)
+                return True
             return False
 
-        user = self._users[user_id]
-        book = self._books[isbn]
+    def borrow_batch(self, requests: List[Tuple[str, str]]) -> List[bool]:
+        """
+        批量借书：一次性获取批次涉及的全部用户锁和图书锁（仍然是先用户后图书），
+        然后按顺序处理每个 (user_id, ISBN) 请求，返回每个请求是否成功
+        """
+        # 加锁前确定有效请求，之后才出现的用户或图书没有被加锁，同样拒绝
+        valid = [user_id in self._users and isbn in self._books for user_id, isbn in requests]
+        locked = [request for request, ok in zip(requests, valid) if ok]
+        results = []
+        with self._user_locks.hold(user_id for user_id, _ in locked), \
+                self._book_locks.hold(isbn for _, isbn in locked):
+            for (user_id, isbn), ok in zip(requests, valid):
+                if not ok:
+                    audit_log.record('rejected', "Unknown user {user_id} or book {isbn}", logging.DEBUG,
+                                     user_id=user_id, isbn=isbn)
+                    results.append(False)
+                    continue
+                user = self._users[user_id]
+                book = self._books[isbn]
+                if len(user.borrowed_books) >= 3:
+                    audit_log.record('limit_hit', "User {user_id} has reached maximum borrowing limit",
+                                     logging.WARNING, user_id=user_id, isbn=isbn)
+                    results.append(False)
+                elif self._borrow_copy_locked(user_id, book):
+                    user.borrowed_books.append(isbn)
+                    results.append(True)
+                else:
+                    results.append(False)
+        return results
+
+    def _borrow_copy_locked(self, user_id: str, book: Book) -> bool:
+        """借出一个副本并更新索引、到期堆和日志，调用方需持有该图书的分段锁"""
+        if not book.borrow_book(user_id):
+            return False
+        if book.available_copies == 0:
+            with self._index_lock:
+                self._available.discard(book.isbn)
+        borrowed_at = book.borrowed_by[user_id]
+        self._track_loan(user_id, book.isbn, borrowed_at)
+        if self._storage is not None:
+            self._storage.append({'op': 'borrow', 'user_id': user_id, 'isbn': book.isbn,
+                                  'ts': borrowed_at.isoformat()})
+        return True
 
-        if len(user.borrowed_books) >= 3:  # 最多借3本书
-            logger.warning(f"User {user_id} has reached maximum borrowing limit")
+    def borrow_copy(self, user_id: str, isbn: str) -> bool:
+        """只处理图书一侧的借出（分片部署中用户的借阅上限由用户所在的分片检查）"""
+        book = self._books.get(isbn)
+        if book is None:
             return False
+        with self._book_locks.lock_for(isbn):
+            return self._borrow_copy_locked(user_id, book)
+
+    def _track_loan(self, user_id: str, isbn: str, borrowed_at: datetime) -> None:
+        """把新的借阅加入到期堆，O(log n)"""
+        with self._due_lock:
+            heapq.heappush(self._due_heap, (borrowed_at + self.loan_period, user_id, isbn, borrowed_at))
+            if self._stale_loans > len(self._due_heap) // 2:
+                self._rebuild_due_heap_locked()
+
+    def _rebuild_due_heap(self) -> None:
+        with self._due_lock:
+            self._rebuild_due_heap_locked()
+
+    def _rebuild_due_heap_locked(self) -> None:
+        """根据当前所有借阅记录重建到期堆，O(n)"""
+        self._due_heap = [
+            (borrowed_at + self.loan_period, user_id, book.isbn, borrowed_at)
+            for book in list(self._books.values())
+            for user_id, borrowed_at in list(book.borrowed_by.items())
+        ]
+        heapq.heapify(self._due_heap)
+        self._stale_loans = 0
+
+    def _loans_due_by(self, deadline: datetime) -> List[Tuple[str, str, datetime]]:
+        """
+        在堆上做剪枝遍历，只访问到期时间不晚于 deadline 的节点：
+        某节点晚于 deadline 时其子树都晚于 deadline，代价为 O(k log k)，k 为结果数量
+        """
+        found = []
+        with self._due_lock:
+            heap = self._due_heap
+            stack = [0] if heap else []
+            while stack:
+                i = stack.pop()
+                due, user_id, isbn, borrowed_at = heap[i]
+                if due > deadline:
+                    continue
+                book = self._books.get(isbn)
+                if book is not None and book.borrowed_by.get(user_id) == borrowed_at:
+                    found.append((user_id, isbn, due))
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        stack.append(child)
+        found.sort(key=lambda loan: loan[2])
+        return found
+
+    def overdue_loans(self, now: Optional[datetime] = None) -> List[Tuple[str, str, datetime]]:
+        """当前已逾期的借阅，返回按到期时间排序的 (user_id, ISBN, 到期时间) 列表"""
+        now = now or datetime.now()
+        return [loan for loan in self._loans_due_by(now) if loan[2] < now]
+
+    def loans_due_within(self, hours: float, now: Optional[datetime] = None) -> List[Tuple[str, str, datetime]]:
+        """未来 hours 小时内到期（尚未逾期）的借阅，按到期时间排序"""
+        now = now or datetime.now()
+        return [loan for loan in self._loans_due_by(now + timedelta(hours=hours)) if loan[2] >= now]
+
+    def check_invariants(self) -> None:
+        """检查借阅数据的一致性，不一致时抛出 AssertionError"""
+        borrowed_by_books = 0
+        for book in self._books.values():
+            assert book.available_copies >= 0, f"Negative copies for {book.isbn}"
+            assert book.available_copies + len(book.borrowed_by) == book.total_copies, \
+                f"Copy count mismatch for {book.isbn}"
+            assert (book.isbn in self._available) == (book.available_copies > 0), \
+                f"Availability index mismatch for {book.isbn}"
+            borrowed_by_books += len(book.borrowed_by)
+        borrowed_by_users = 0
+        for user in self._users.values():
+            assert len(user.borrowed_books) <= 3, f"User {user.user_id} exceeds borrowing limit"
+            borrowed_by_users += len(user.borrowed_books)
+        assert borrowed_by_books == borrowed_by_users, "Loan records of books and users differ"
+
+
+def shard_for_isbn(isbn: str, num_shards: int) -> int:
+    """按 ISBN 的稳定哈希（不受进程哈希随机化影响）确定图书所在分片"""
+    return zlib.crc32(isbn.encode('utf-8')) % num_shards
+
 
-        if book.borrow_book(user_id):
-            user.borrowed_books.append(isbn)
+def _shard_worker(shard_id: int, num_shards: int, conn) -> None:
+    """
+    分片工作进程：每次接收一批命令，按顺序执行后返回结果列表；
+    用户的借阅名额预留只在用户所在分片维护，进程内单线程处理，不需要加锁
+    """
+    logger.setLevel(logging.ERROR)
+    LibrarySystem.reset_instance()
+    library = LibrarySystem()
+    library._user_ids = UserIdAllocator(shard_id, num_shards)
+    reserved: Dict[str, int] = {}  # user_id -> 已预留但尚未确认的借阅数
+
+    def _execute(command: tuple):
+        op = command[0]
+        if op == 'add_book':
+            _, title, author, isbn, copies = command
+            library.add_book(Book(title, Author(*author), isbn, copies))
+            return True
+        if op == 'register_user':
+            return library.register_user(command[1])
+        if op == 'reserve':
+            user = library._users.get(command[1])
+            if user is None or len(user.borrowed_books) + reserved.get(user.user_id, 0) >= 3:
+                return False
+            reserved[user.user_id] = reserved.get(user.user_id, 0) + 1
             return True
-        return False
+        if op == 'borrow_copy':
+            return library.borrow_copy(command[1], command[2])
+        if op == 'commit':
+            _, user_id, isbn, borrowed = command
+            reserved[user_id] -= 1
+            if borrowed:
+                library._users[user_id].borrowed_books.append(isbn)
+            return True
+        if op == 'stats':
+            return {'books': len(library._books), 'users': len(library._users)}
+        raise ValueError(f"Unknown shard command: {op}")
+
+    while True:
+        commands = conn.recv()
+        if commands is None:
+            break
+        conn.send([_execute(command) for command in commands])
+    conn.close()
+
+
+class ShardedLibrary:
+    """
+    分片部署的图书馆：图书按 ISBN 哈希分布到多个工作进程，用户ID由各分片交错分配；
+    借书分三步：在用户所在分片预留名额 -> 在图书所在分片借出副本 -> 回到用户分片确认或释放名额，
+    每一步都把命令按分片分组后并行发送
+    """
+
+    def __init__(self, num_shards: int = 4):
+        self.num_shards = num_shards
+        self._connections = []
+        self._processes = []
+        self._next_home = 0
+        for shard_id in range(num_shards):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_shard_worker, args=(shard_id, num_shards, child_conn),
+                                              daemon=True)
+            process.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+
+    def _dispatch(self, commands: Dict[int, List[tuple]]) -> Dict[int, list]:
+        """先向所有分片发送命令批次，再统一接收结果，使各分片并行处理"""
+        for shard_id, batch in commands.items():
+            self._connections[shard_id].send(batch)
+        return {shard_id: self._connections[shard_id].recv() for shard_id in commands}
+
+    def add_books(self, books: Iterable[Book]) -> None:
+        commands: Dict[int, List[tuple]] = {}
+        for book in books:
+            author = book.author
+            commands.setdefault(shard_for_isbn(book.isbn, self.num_shards), []).append(
+                ('add_book', book.title, (author.name, author.birth_year, author.nationality),
+                 book.isbn, book.total_copies)
+            )
+        self._dispatch(commands)
+
+    def add_book(self, book: Book) -> None:
+        self.add_books([book])
+
+    def register_users(self, names: List[str]) -> List[str]:
+        """按轮询方式把用户分配到各分片注册，返回与 names 顺序一致的用户ID"""
+        commands: Dict[int, List[tuple]] = {}
+        order = []
+        for name in names:
+            shard_id = self._next_home
+            self._next_home = (self._next_home + 1) % self.num_shards
+            order.append((shard_id, len(commands.setdefault(shard_id, []))))
+            commands[shard_id].append(('register_user', name))
+        results = self._dispatch(commands)
+        return [results[shard_id][i] for shard_id, i in order]
+
+    def register_user(self, name: str) -> str:
+        return self.register_users([name])[0]
+
+    def borrow_many(self, requests: List[Tuple[str, str]]) -> List[bool]:
+        """批量借书，requests 为 (user_id, ISBN) 列表，返回每个请求是否成功"""
+        def _grouped(items: List[Tuple[int, tuple]]) -> Tuple[Dict[int, List[tuple]], List[Tuple[int, int]]]:
+            commands: Dict[int, List[tuple]] = {}
+            positions = []
+            for shard_id, command in items:
+                batch = commands.setdefault(shard_id, [])
+                positions.append((shard_id, len(batch)))
+                batch.append(command)
+            return commands, positions
+
+        homes = [UserIdAllocator.home_shard(user_id, self.num_shards) for user_id, _ in requests]
+
+        # 第一步：在用户所在分片预留借阅名额
+        commands, positions = _grouped([(home, ('reserve', user_id))
+                                        for home, (user_id, _) in zip(homes, requests)])
+        results = self._dispatch(commands)
+        reserved = [results[shard_id][i] for shard_id, i in positions]
+
+        # 第二步：在图书所在分片借出副本
+        pending = [k for k, ok in enumerate(reserved) if ok]
+        commands, positions = _grouped([
+            (shard_for_isbn(requests[k][1], self.num_shards), ('borrow_copy',) + tuple(requests[k]))
+            for k in pending
+        ])
+        results = self._dispatch(commands)
+        borrowed = [False] * len(requests)
+        for k, (shard_id, i) in zip(pending, positions):
+            borrowed[k] = results[shard_id][i]
+
+        # 第三步：确认或释放预留的名额
+        commands, _ = _grouped([(homes[k], ('commit', requests[k][0], requests[k][1], borrowed[k]))
+                                for k in pending])
+        self._dispatch(commands)
+        return borrowed
+
+    def borrow_book(self, user_id: str, isbn: str) -> bool:
+        return self.borrow_many([(user_id, isbn)])[0]
+
+    def stats(self) -> List[dict]:
+        results = self._dispatch({shard_id: [('stats',)] for shard_id in range(self.num_shards)})
+        return [results[shard_id][0] for shard_id in range(self.num_shards)]
+
+    def close(self) -> None:
+        for conn in self._connections:
+            conn.send(None)
+            conn.close()
+        for process in self._processes:
+            process.join()
+
+    def __enter__(self) -> 'ShardedLibrary':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def benchmark_sharding(shard_counts: Tuple[int, ...] = (1, 2, 4), n_books: int = 20000,
+                       n_users: int = 20000, n_requests: int = 100000, batch_size: int = 1000,
+                       seed: int = 0) -> Dict[int, float]:
+    """分片部署的借书吞吐量基准测试，返回每种分片数下每秒处理的借书请求数"""
+    throughput = {}
+    for num_shards in shard_counts:
+        rng = random.Random(seed)
+        with ShardedLibrary(num_shards) as library:
+            author = Author("Shard Author", 1970, "Unknown")
+            isbns = [f"ISBN{i:07d}" for i in range(n_books)]
+            library.add_books(Book(f"Book {isbn}", author, isbn, 5) for isbn in isbns)
+            user_ids = library.register_users([f"User {i}" for i in range(n_users)])
+            requests = [(rng.choice(user_ids), rng.choice(isbns)) for _ in range(n_requests)]
+
+            start = time.perf_counter()
+            for i in range(0, n_requests, batch_size):
+                library.borrow_many(requests[i:i + batch_size])
+            elapsed = time.perf_counter() - start
+
+        throughput[num_shards] = n_requests / elapsed
+        print(f"{num_shards} shards: {throughput[num_shards]:,.0f} borrow requests/s")
+    return throughput
+
+
+def _book_to_dict(book: Book) -> dict:
+    return {'title': book.title, 'isbn': book.isbn, 'author': book.author.name,
+            'total_copies': book.total_copies, 'available_copies': book.available_copies}
+
+
+class LibraryServer:
+    """
+    图书馆的 asyncio 服务端，协议为按行分隔的 JSON：
+    请求 {"id": 1, "op": "borrow", "user_id": ..., "isbn": ...}，响应 {"id": 1, "ok": true, "result": ...}；
+    支持的操作：add_book, register_user, borrow, search。
+    同一时间窗口内到达的借书请求合并成一批，通过 LibrarySystem.borrow_batch 一次加锁处理
+    """
+
+    def __init__(self, library: LibrarySystem, host: str = '127.0.0.1', port: int = 8765,
+                 batch_window: float = 0.002, max_batch: int = 256):
+        self.library = library
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.batch_sizes: List[int] = []  # 每批借书请求数，用于观察合并效果
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # port=0 时取实际端口
+        logger.info(f"Library server listening on {self.host}:{self.port}")
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        self._flush()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _flush(self) -> None:
+        """处理当前积累的全部借书请求"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batch_sizes.append(len(batch))
+        try:
+            results = self.library.borrow_batch([(user_id, isbn) for user_id, isbn, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _borrow(self, user_id: str, isbn: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, isbn, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return future
+
+    async def _execute(self, request: dict):
+        op = request.get('op')
+        if op == 'borrow':
+            return await self._borrow(request['user_id'], request['isbn'])
+        if op == 'register_user':
+            return self.library.register_user(request['name'])
+        if op == 'add_book':
+            author = Author(**request['author'])
+            self.library.add_book(Book(request['title'], author, request['isbn'], request['copies']))
+            return True
+        if op == 'search':
+            books = self.library.search(author=request.get('author'), title_prefix=request.get('title_prefix'),
+                                        available_only=request.get('available_only', False),
+                                        limit=request.get('limit'))
+            return [_book_to_dict(book) for book in books]
+        raise ValueError(f"Unknown operation: {op}")
+
+    async def _respond(self, request: dict, writer: asyncio.StreamWriter) -> None:
+        try:
+            response = {'id': request.get('id'), 'ok': True, 'result': await self._execute(request)}
+        except Exception as e:
+            response = {'id': request.get('id'), 'ok': False, 'error': str(e)}
+        writer.write(json.dumps(response).encode('utf-8') + b'\n')
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # 同一连接上的请求可以流水线发送，响应按完成顺序返回，客户端用 id 对应
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    writer.write(json.dumps({'id': None, 'ok': False, 'error': str(e)}).encode('utf-8') + b'\n')
+                    continue
+                task = asyncio.create_task(self._respond(request, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if writer.transport.get_write_buffer_size() > 1 << 16:
+                    await writer.drain()
+            if tasks:
+                await asyncio.gather(*tasks)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class LibraryClient:
+    """LibraryServer 的异步客户端，支持在一个连接上并发发送多个请求"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765):
+        self.host = host
+        self.port = port
+        self._next_id = 0
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._receiver: Optional[asyncio.Task] = None
+
+    async def connect(self) -> 'LibraryClient':
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._receiver = asyncio.create_task(self._receive())
+        return self
+
+    async def _receive(self) -> None:
+        try:
+            while line := await self._reader.readline():
+                response = json.loads(line)
+                future = self._waiting.pop(response['id'], None)
+                if future is None or future.done():
+                    continue
+                if response['ok']:
+                    future.set_result(response['result'])
+                else:
+                    future.set_exception(RuntimeError(response['error']))
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+            self._waiting.clear()
+
+    async def request(self, op: str, **params):
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[self._next_id] = future
+        self._writer.write(json.dumps({'id': self._next_id, 'op': op, **params}).encode('utf-8') + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def add_book(self, title: str, author: Author, isbn: str, copies: int) -> bool:
+        return await self.request('add_book', title=title, isbn=isbn, copies=copies,
+                                  author={'name': author.name, 'birth_year': author.birth_year,
+                                          'nationality': author.nationality})
+
+    async def register_user(self, name: str) -> str:
+        return await self.request('register_user', name=name)
+
+    async def borrow_book(self, user_id: str, isbn: str) -> bool:
+        return await self.request('borrow', user_id=user_id, isbn=isbn)
+
+    async def search(self, **criteria) -> List[dict]:
+        return await self.request('search', **criteria)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+        if self._receiver is not None:
+            await self._receiver
+
+
+async def run_load_generator(host: str = '127.0.0.1', port: int = 8765, n_clients: int = 16,
+                             requests_per_client: int = 2000, concurrency: int = 8,
+                             n_books: int = 2000, n_users: int = 5000, seed: int = 0) -> dict:
+    """
+    负载生成器：先通过服务端准备图书和用户，然后每个客户端连接保持 concurrency 个在途借书请求，
+    统计每个请求的往返延迟，返回 p50/p99 延迟（毫秒）和每秒请求数
+    """
+    rng = random.Random(seed)
+    setup = await LibraryClient(host, port).connect()
+    author = Author("Load Author", 1970, "Unknown")
+    isbns = [f"LOAD{i:07d}" for i in range(n_books)]
+    await asyncio.gather(*(setup.add_book(f"Book {isbn}", author, isbn, 5) for isbn in isbns))
+    user_ids = await asyncio.gather(*(setup.register_user(f"Load User {i}") for i in range(n_users)))
+    await setup.close()
+
+    latencies: List[float] = []
+    successes = 0
+
+    async def _client(client_seed: int) -> None:
+        nonlocal successes
+        client_rng = random.Random(client_seed)
+        client = await LibraryClient(host, port).connect()
+        remaining = requests_per_client
+
+        async def _worker() -> None:
+            nonlocal remaining, successes
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                if await client.borrow_book(client_rng.choice(user_ids), client_rng.choice(isbns)):
+                    successes += 1
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(_worker() for _ in range(concurrency)))
+        await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(rng.randrange(1 << 30)) for _ in range(n_clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    stats = {
+        'requests': len(latencies),
+        'successful_borrows': successes,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+    print(f"{stats['requests']} borrow requests from {n_clients} clients: "
+          f"{stats['requests_per_second']:,.0f} requests/s, "
+          f"p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms")
+    return stats
+
+
+async def _serve_and_load_test(port: int) -> dict:
+    """在同一个进程里启动服务端并运行负载生成器"""
+    previous_level = logger.level
+    logger.setLevel(logging.ERROR)
+    LibrarySystem.reset_instance()
+    server = LibraryServer(LibrarySystem(), port=port)
+    await server.start()
+    try:
+        stats = await run_load_generator(port=server.port)
+        stats['mean_batch_size'] = sum(server.batch_sizes) / max(len(server.batch_sizes), 1)
+        print(f"mean borrow batch size: {stats['mean_batch_size']:.1f}")
+        return stats
+    finally:
+        await server.close()
+        logger.setLevel(previous_level)
+        LibrarySystem.reset_instance()
+
+
+def stress_test_borrowing(thread_counts: Tuple[int, ...] = (1, 2, 4, 8), n_books: int = 1000,
+                          n_users: int = 20000, ops_per_thread: int = 20000, seed: int = 0) -> Dict[int, float]:
+    """
+    并发借书压力测试：每种线程数下用全新的系统随机借书，
+    返回每秒借书请求数，并在每轮结束后检查数据一致性
+    """
+    previous_level = logger.level
+    logger.setLevel(logging.ERROR)  # 避免逐条日志影响测量
+    throughput = {}
+    try:
+        for n_threads in thread_counts:
+            LibrarySystem.reset_instance()
+            library = LibrarySystem()
+            author = Author("Stress Author", 1970, "Unknown")
+            isbns = [f"ISBN{i:07d}" for i in range(n_books)]
+            for isbn in isbns:
+                library.add_book(Book(f"Book {isbn}", author, isbn, 5))
+            user_ids = [library.register_user(f"User {i}") for i in range(n_users)]
+
+            def _worker(worker_seed: int) -> None:
+                rng = random.Random(worker_seed)
+                for _ in range(ops_per_thread):
+                    library.borrow_book(rng.choice(user_ids), rng.choice(isbns))
+
+            threads = [threading.Thread(target=_worker, args=(seed + i,)) for i in range(n_threads)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            library.check_invariants()
+            throughput[n_threads] = n_threads * ops_per_thread / elapsed
+            print(f"{n_threads} threads: {throughput[n_threads]:,.0f} borrow requests/s, invariants OK")
+    finally:
+        logger.setLevel(previous_level)
+        LibrarySystem.reset_instance()
+    return throughput
+
+
+DEFAULT_WORKLOAD_MIX = {'borrow': 0.5, 'search': 0.2, 'find_by_author': 0.1,
+                        'register_user': 0.1, 'add_book': 0.1}
+
+
+def _populate(library: LibrarySystem, n_books: int, n_users: int, n_authors: int,
+              rng: random.Random) -> Tuple[List[str], List[str], List[Author]]:
+    """用模拟数据填充目录和用户，返回 ISBN 列表、用户ID列表和作者列表"""
+    authors = [Author(f"Author {i}", 1900 + i % 100, "Unknown") for i in range(n_authors)]
+    isbns = [f"ISBN{i:09d}" for i in range(n_books)]
+    for isbn in isbns:
+        library.add_book(Book(f"Title {rng.randrange(10 ** 6):06d} {isbn}", rng.choice(authors), isbn,
+                              rng.randint(1, 5)))
+    user_ids = [library.register_user(f"User {i}") for i in range(n_users)]
+    return isbns, user_ids, authors
+
+
+def _memory_per_record(n_books: int, n_users: int, seed: int) -> dict:
+    """用 tracemalloc 测量每本图书、每个用户占用的内存（当前值和峰值，字节）"""
+    LibrarySystem.reset_instance()
+    library = LibrarySystem()
+    rng = random.Random(seed)
+    authors = [Author(f"Author {i}", 1900 + i % 100, "Unknown") for i in range(100)]
+    tracemalloc.start()
+    try:
+        for i in range(n_books):
+            library.add_book(Book(f"Title {rng.randrange(10 ** 6):06d}", rng.choice(authors), f"ISBN{i:09d}", 3))
+        books_current, books_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for i in range(n_users):
+            library.register_user(f"User {i}")
+        users_current, users_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        LibrarySystem.reset_instance()
+    return {
+        'bytes_per_book': books_current / n_books,
+        'peak_bytes_per_book': books_peak / n_books,
+        'bytes_per_user': (users_current - books_current) / n_users,
+        'peak_bytes_per_user': (users_peak - books_current) / n_users,
+    }
+
+
+def _make_workload(n_ops: int, mix: Dict[str, float], isbns: List[str], user_ids: List[str],
+                   authors: List[Author], rng: random.Random) -> List[tuple]:
+    """按比例生成混合操作序列，新增图书使用不与已有数据冲突的 ISBN"""
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    ops = []
+    for i, kind in enumerate(rng.choices(kinds, weights, k=n_ops)):
+        if kind == 'borrow':
+            ops.append((kind, rng.choice(user_ids), rng.choice(isbns)))
+        elif kind == 'search':
+            ops.append((kind, f"Title {rng.randrange(1000):03d}"))
+        elif kind == 'find_by_author':
+            ops.append((kind, rng.choice(authors).name))
+        elif kind == 'register_user':
+            ops.append((kind, f"New User {i}"))
+        elif kind == 'add_book':
+            ops.append((kind, Book(f"New Title {i}", rng.choice(authors), f"NEW{i:09d}", 2)))
+        else:
+            raise ValueError(f"Unknown workload operation: {kind}")
+    return ops
+
+
+def _replay(library: LibrarySystem, ops: List[tuple]) -> Dict[str, List[float]]:
+    """依次执行操作，按操作类型记录每次调用的耗时（秒）"""
+    handlers = {
+        'borrow': library.borrow_book,
+        'search': lambda prefix: library.search(title_prefix=prefix, limit=10),
+        'find_by_author': library.find_by_author,
+        'register_user': library.register_user,
+        'add_book': library.add_book,
+    }
+    latencies: Dict[str, List[float]] = {kind: [] for kind in handlers}
+    clock = time.perf_counter
+    for kind, *args in ops:
+        start = clock()
+        handlers[kind](*args)
+        latencies[kind].append(clock() - start)
+    return latencies
+
+
+def _latency_summary(latencies: List[float]) -> dict:
+    """延迟分位数（微秒）"""
+    if not latencies:
+        return {'count': 0}
+    latencies = sorted(latencies)
+
+    def _at(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1e6
+
+    return {'count': len(latencies), 'p50_us': _at(0.5), 'p90_us': _at(0.9), 'p99_us': _at(0.99),
+            'max_us': latencies[-1] * 1e6}
+
+
+def run_benchmark(n_books: int = 20000, n_users: int = 20000, n_ops: int = 100000,
+                  thread_counts: Tuple[int, ...] = (1, 4), mix: Optional[Dict[str, float]] = None,
+                  seed: int = 0, output: Optional[str] = None) -> dict:
+    """
+    图书馆负载测试：按指定规模填充模拟数据，分别用单线程和多线程回放混合工作负载，
+    统计每秒操作数、各操作的延迟分位数和每条记录的内存占用，结果以 JSON 格式保存，便于不同版本之间对比
+    """
+    mix = mix or DEFAULT_WORKLOAD_MIX
+    previous_level = logger.level
+    logger.setLevel(logging.ERROR)
+    try:
+        memory = _memory_per_record(min(n_books, 20000), min(n_users, 20000), seed)
+
+        scenarios = {}
+        for n_threads in thread_counts:
+            LibrarySystem.reset_instance()
+            library = LibrarySystem()
+            rng = random.Random(seed)
+            start = time.perf_counter()
+            isbns, user_ids, authors = _populate(library, n_books, n_users, max(1, n_books // 20), rng)
+            populate_seconds = time.perf_counter() - start
+
+            ops = _make_workload(n_ops, mix, isbns, user_ids, authors, rng)
+            chunks = [ops[i::n_threads] for i in range(n_threads)]
+            results: List[Dict[str, List[float]]] = [{} for _ in range(n_threads)]
+
+            def _worker(index: int) -> None:
+                results[index] = _replay(library, chunks[index])
+
+            threads = [threading.Thread(target=_worker, args=(i,)) for i in range(n_threads)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            library.check_invariants()
+
+            per_op = {kind: _latency_summary([t for result in results for t in result.get(kind, ())])
+                      for kind in mix}
+            scenarios[f"mixed_{n_threads}_threads"] = {
+                'threads': n_threads,
+                'populate_records_per_second': (n_books + n_users) / populate_seconds,
+                'ops_per_second': n_ops / elapsed,
+                'latency': _latency_summary([t for result in results for ts in result.values() for t in ts]),
+                'per_operation': per_op,
+            }
+    finally:
+        logger.setLevel(previous_level)
+        LibrarySystem.reset_instance()
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': {'n_books': n_books, 'n_users': n_users, 'n_ops': n_ops,
+                   'thread_counts': list(thread_counts), 'mix': mix, 'seed': seed},
+        'environment': {'python': platform.python_version(), 'machine': platform.machine(),
+                        'cpu_count': os.cpu_count()},
+        'memory': memory,
+        'scenarios': scenarios,
+    }
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return results
 
 
 def main():
@@ -141,4 +1599,31 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='图书馆系统')
+    parser.add_argument('--stress', action='store_true', help='运行并发借书压力测试')
+    parser.add_argument('--shards', action='store_true', help='运行分片部署的吞吐量基准测试')
+    parser.add_argument('--serve', action='store_true', help='启动 asyncio 服务端')
+    parser.add_argument('--load-test', action='store_true', help='启动服务端并运行负载生成器')
+    parser.add_argument('--port', type=int, default=8765, help='服务端端口')
+    parser.add_argument('--benchmark', action='store_true', help='使用模拟数据运行混合负载基准测试')
+    parser.add_argument('--books', type=int, default=20000, help='基准测试的图书数量')
+    parser.add_argument('--users', type=int, default=20000, help='基准测试的用户数量')
+    parser.add_argument('--ops', type=int, default=100000, help='基准测试回放的操作数量')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4], help='基准测试的线程数')
+    parser.add_argument('--seed', type=int, default=0, help='模拟数据的随机种子')
+    parser.add_argument('--output', help='基准测试结果的 JSON 文件路径')
+    args = parser.parse_args()
+
+    if args.stress:
+        stress_test_borrowing()
+    elif args.shards:
+        benchmark_sharding()
+    elif args.serve:
+        asyncio.run(LibraryServer(LibrarySystem(), port=args.port).serve_forever())
+    elif args.load_test:
+        asyncio.run(_serve_and_load_test(args.port))
+    elif args.benchmark:
+        print(json.dumps(run_benchmark(args.books, args.users, args.ops, tuple(args.threads),
+                                       seed=args.seed, output=args.output), indent=2))
+    else:
+        main()
\ No newline at end of file
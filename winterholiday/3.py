@@ -3,10 +3,27 @@ import numpy as np
 from datetime import datetime, timedelta
 import yfinance as yf
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import seaborn as sns
-from typing import Optional, List, Dict, Tuple
+from typing import (Optional, List, Dict, Tuple, Callable, Awaitable, AsyncIterator, Iterator,
+                    MutableMapping, Union, BinaryIO)
 from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from pathlib import Path
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import time
 import logging
 
 # 设置日志配置
@@ -28,50 +45,739 @@ class StockMetrics:
     beta: float
 
 
+class OnlineMetrics:
+    """
+    单只股票的增量指标累加器：Welford 算法维护均值和方差、
+    与市场收益率的协方差（用于贝塔系数），以及累积收益的运行峰值（用于最大回撤），
+    每根新K线的更新代价为 O(1)
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.count = 0
+        self.mean_stock = 0.0
+        self.mean_market = 0.0
+        self.m2_stock = 0.0  # 离差平方和
+        self.m2_market = 0.0
+        self.co_moment = 0.0  # 离差乘积和
+        self.cumulative_return = 1.0
+        self.peak = -np.inf
+        self.max_drawdown = 0.0
+        self.last_close: Optional[float] = None
+
+    @classmethod
+    def from_history(cls, symbol: str, stock_returns: np.ndarray, market_returns: np.ndarray,
+                     last_close: Optional[float]) -> 'OnlineMetrics':
+        """用已对齐的历史收益率一次性初始化累加器"""
+        acc = cls(symbol)
+        acc.last_close = last_close
+        if len(stock_returns) == 0:
+            return acc
+
+        acc.count = len(stock_returns)
+        acc.mean_stock = float(stock_returns.mean())
+        acc.mean_market = float(market_returns.mean())
+        stock_dev = stock_returns - acc.mean_stock
+        market_dev = market_returns - acc.mean_market
+        acc.m2_stock = float(stock_dev @ stock_dev)
+        acc.m2_market = float(market_dev @ market_dev)
+        acc.co_moment = float(stock_dev @ market_dev)
+
+        cumulative_returns = np.cumprod(1.0 + stock_returns)
+        rolling_max = np.maximum.accumulate(cumulative_returns)
+        acc.cumulative_return = float(cumulative_returns[-1])
+        acc.peak = float(rolling_max[-1])
+        acc.max_drawdown = float((cumulative_returns / rolling_max - 1).min())
+        return acc
+
+    def update(self, stock_return: float, market_return: float) -> None:
+        """加入一对已对齐的日收益率"""
+        self.count += 1
+        stock_delta = stock_return - self.mean_stock
+        market_delta = market_return - self.mean_market
+        self.mean_stock += stock_delta / self.count
+        self.mean_market += market_delta / self.count
+        self.m2_stock += stock_delta * (stock_return - self.mean_stock)
+        self.m2_market += market_delta * (market_return - self.mean_market)
+        self.co_moment += stock_delta * (market_return - self.mean_market)
+
+        self.cumulative_return *= 1 + stock_return
+        self.peak = max(self.peak, self.cumulative_return)
+        self.max_drawdown = min(self.max_drawdown, self.cumulative_return / self.peak - 1)
+
+    def metrics(self, risk_free_rate: float) -> StockMetrics:
+        """根据当前累加值生成指标，样本数不足时为 NaN"""
+        if self.count < 2:
+            nan = float('nan')
+            max_drawdown = self.max_drawdown if self.count else nan
+            return StockMetrics(self.symbol, nan, nan, nan, max_drawdown, nan)
+
+        mean_return = self.mean_stock * 252
+        volatility = np.sqrt(self.m2_stock / (self.count - 1)) * np.sqrt(252)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe_ratio = (mean_return - risk_free_rate) / np.float64(volatility)
+            beta = np.float64(self.co_moment) / self.m2_market
+        return StockMetrics(
+            symbol=self.symbol,
+            mean_return=mean_return,
+            volatility=float(volatility),
+            sharpe_ratio=float(sharpe_ratio),
+            max_drawdown=self.max_drawdown,
+            beta=float(beta)
+        )
+
+
+class PriceCache:
+    """
+    本地价格缓存：每只股票一个目录，每列存为一个 .npy 文件（读取时内存映射），
+    meta.json 记录列名和已缓存的日期区间，用于计算需要补充下载的缺口
+    """
+
+    def __init__(self, cache_dir: str, offline: bool = False):
+        self.cache_dir = Path(cache_dir)
+        self.offline = offline  # 离线模式：只从缓存读取，不访问数据源
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _symbol_dir(self, symbol: str) -> Path:
+        # 股票代码中可能包含 ^ 等字符，转换为安全的目录名
+        return self.cache_dir / re.sub(r'[^A-Za-z0-9._-]', '_', symbol)
+
+    def _read_meta(self, symbol: str) -> Optional[dict]:
+        meta_path = self._symbol_dir(symbol) / 'meta.json'
+        if not meta_path.exists():
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _merge_ranges(ranges: List[Tuple[pd.Timestamp, pd.Timestamp]]) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """合并重叠或相邻的区间"""
+        merged: List[Tuple[pd.Timestamp, pd.Timestamp]] = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def covered_ranges(self, symbol: str) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """已缓存的日期区间列表，左闭右开"""
+        meta = self._read_meta(symbol)
+        if meta is None:
+            return []
+        return [(pd.Timestamp(start), pd.Timestamp(end)) for start, end in meta['ranges']]
+
+    def missing_ranges(self, symbol: str, start_date: str, end_date: str) -> List[Tuple[str, str]]:
+        """计算 [start_date, end_date) 中尚未缓存的日期区间"""
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        gaps = []
+        cursor = start
+        for covered_start, covered_end in self.covered_ranges(symbol):
+            if covered_end <= cursor:
+                continue
+            if covered_start >= end:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return [(s.strftime('%Y-%m-%d'), e.strftime('%Y-%m-%d')) for s, e in gaps]
+
+    def load(self, symbol: str, start_date: Optional[str] = None,
+             end_date: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """从缓存读取 [start_date, end_date) 的数据，只读取需要的行"""
+        meta = self._read_meta(symbol)
+        if meta is None:
+            return None
+
+        symbol_dir = self._symbol_dir(symbol)
+        index = np.load(symbol_dir / 'index.npy', mmap_mode='r')
+        lo = 0 if start_date is None else np.searchsorted(index, pd.Timestamp(start_date).value, side='left')
+        hi = len(index) if end_date is None else np.searchsorted(index, pd.Timestamp(end_date).value, side='left')
+
+        columns = {
+            name: np.array(np.load(symbol_dir / f'col_{i}.npy', mmap_mode='r')[lo:hi])
+            for i, name in enumerate(meta['columns'])
+        }
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(np.array(index[lo:hi]).view('datetime64[ns]'), name='Date'))
+
+    def store(self, symbol: str, data: pd.DataFrame, start_date: str, end_date: str) -> None:
+        """将 [start_date, end_date) 的下载结果合并进缓存，并记录该区间已缓存"""
+        existing = self.load(symbol)
+        if existing is not None and not existing.empty:
+            data = pd.concat([existing, data])
+            data = data[~data.index.duplicated(keep='last')]
+        data = data.sort_index()
+
+        # 当天的行情可能还不完整，不将今天及以后标记为已缓存
+        end = min(pd.Timestamp(end_date), pd.Timestamp.today().normalize())
+        ranges = self.covered_ranges(symbol)
+        if pd.Timestamp(start_date) < end:
+            ranges.append((pd.Timestamp(start_date), end))
+        ranges = self._merge_ranges(ranges)
+
+        symbol_dir = self._symbol_dir(symbol)
+        symbol_dir.mkdir(parents=True, exist_ok=True)
+        arrays = {'index.npy': data.index.to_numpy(dtype='datetime64[ns]').view(np.int64)}
+        for i, name in enumerate(data.columns):
+            arrays[f'col_{i}.npy'] = data[name].to_numpy(dtype=np.float64)
+        # 先写临时文件再替换，避免中途失败留下不完整的缓存
+        for file_name, array in arrays.items():
+            tmp_path = symbol_dir / (file_name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, symbol_dir / file_name)
+
+        meta = {
+            'columns': [str(name) for name in data.columns],
+            'ranges': [(s.strftime('%Y-%m-%d'), e.strftime('%Y-%m-%d')) for s, e in ranges],
+        }
+        tmp_meta = symbol_dir / 'meta.json.tmp'
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, symbol_dir / 'meta.json')
+
+    async def get(self, symbol: str, start_date: str, end_date: str,
+                  fetch: Callable[[str, str, str], Awaitable[Optional[pd.DataFrame]]]) -> Optional[pd.DataFrame]:
+        """
+        读取数据：只对缺失的日期区间调用 fetch 下载并写入缓存，
+        离线模式下直接返回缓存中已有的数据
+        """
+        missing = await asyncio.to_thread(self.missing_ranges, symbol, start_date, end_date)
+        if not self.offline:
+            for gap_start, gap_end in missing:
+                data = await fetch(symbol, gap_start, gap_end)
+                if data is not None:
+                    await asyncio.to_thread(self.store, symbol, data, gap_start, gap_end)
+        elif missing:
+            logger.warning(f"Offline mode: cached data for {symbol} does not cover {start_date} - {end_date}")
+        return await asyncio.to_thread(self.load, symbol, start_date, end_date)
+
+
+class CompactPriceStore(MutableMapping):
+    """
+    紧凑的价格存储：所有股票共享一个 DatetimeIndex，收盘价存放在一个按列连续的
+    日期×股票 矩阵中（默认 float32），缺失日期为 NaN；
+    其他列（开盘价、成交量等）不常驻内存，需要时通过 loader 按需加载
+    """
+
+    def __init__(self, dtype=np.float32, loader: Optional[Callable[[str], Optional[pd.DataFrame]]] = None):
+        self.dtype = np.dtype(dtype)
+        self.loader = loader
+        self.index = pd.DatetimeIndex([])
+        self._closes = np.empty((0, 0), dtype=self.dtype, order='F')
+        self._slots: Dict[str, int] = {}  # symbol -> 矩阵列号
+        self._free_slots: List[int] = []
+
+    def _ensure_index(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """确保共享索引包含 index 中的所有日期，返回这些日期在共享索引中的位置"""
+        if self.index.equals(index):
+            return np.arange(len(index))
+        positions = self.index.get_indexer(index)
+        if (positions < 0).any():
+            new_index = self.index.union(index)
+            closes = np.full((len(new_index), self._closes.shape[1]), np.nan, dtype=self.dtype, order='F')
+            closes[new_index.get_indexer(self.index)] = self._closes
+            self.index, self._closes = new_index, closes
+            positions = self.index.get_indexer(index)
+        return positions
+
+    def _allocate_slot(self) -> int:
+        if self._free_slots:
+            return self._free_slots.pop()
+        slot = len(self._slots)
+        capacity = self._closes.shape[1]
+        if slot >= capacity:
+            # 容量按倍数增长，摊还后追加一只股票是 O(行数)
+            closes = np.full((len(self.index), max(8, capacity * 2)), np.nan, dtype=self.dtype, order='F')
+            closes[:, :capacity] = self._closes
+            self._closes = closes
+        return slot
+
+    def __setitem__(self, symbol: str, data: pd.DataFrame) -> None:
+        close = data['Close']
+        positions = self._ensure_index(close.index)
+        slot = self._slots.get(symbol)
+        if slot is None:
+            slot = self._slots[symbol] = self._allocate_slot()
+        column = self._closes[:, slot]
+        column[:] = np.nan
+        column[positions] = close.to_numpy()
+
+    def __getitem__(self, symbol: str) -> pd.DataFrame:
+        """返回只含 Close 列的 DataFrame（仅包含该股票有数据的日期）"""
+        column = self._closes[:, self._slots[symbol]]
+        valid = ~np.isnan(column)
+        return pd.DataFrame({'Close': column[valid]}, index=self.index[valid])
+
+    def __delitem__(self, symbol: str) -> None:
+        slot = self._slots.pop(symbol)
+        self._closes[:, slot] = np.nan
+        self._free_slots.append(slot)
+
+    def __contains__(self, symbol) -> bool:
+        return symbol in self._slots
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._slots)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def full(self, symbol: str) -> Optional[pd.DataFrame]:
+        """按需加载股票的完整数据（所有列）"""
+        if symbol not in self._slots:
+            return None
+        if self.loader is None:
+            return self[symbol]
+        return self.loader(symbol)
+
+    def memory_usage(self) -> int:
+        """收盘价矩阵和共享索引占用的字节数"""
+        return self._closes.nbytes + self.index.nbytes
+
+
+class DataSource(ABC):
+    """
+    行情数据源接口，子类实现异步的 fetch 方法
+    rate_limit 为每秒最多发起的请求数，None 表示不限速
+    """
+
+    def __init__(self, rate_limit: Optional[float] = None):
+        self.rate_limit = rate_limit
+        self._next_slot = 0.0
+
+    async def throttle(self) -> None:
+        """按 rate_limit 等待下一个请求时间片"""
+        if not self.rate_limit:
+            return
+        # 事件循环是单线程的，读取和更新 _next_slot 之间没有 await，不需要加锁
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1.0 / self.rate_limit
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    @abstractmethod
+    async def fetch(self, symbol: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        """获取单只股票 [start_date, end_date) 的历史数据"""
+
+
+class YahooDataSource(DataSource):
+    """Yahoo Finance 数据源，阻塞的下载调用放到线程中执行"""
+
+    @staticmethod
+    def _download(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        data = yf.Ticker(symbol).history(start=start_date, end=end_date)
+        # 确保时区一致
+        data.index = data.index.tz_localize(None)
+        return data
+
+    async def fetch(self, symbol: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        return await asyncio.to_thread(self._download, symbol, start_date, end_date)
+
+
+class LocalFileDataSource(DataSource):
+    """
+    本地文件数据源：从 <directory>/<symbol>.csv 读取数据，
+    latency 可模拟网络延迟，用于无网络环境下的测试和基准测试
+    """
+
+    def __init__(self, directory: str, latency: float = 0.0, rate_limit: Optional[float] = None):
+        super().__init__(rate_limit)
+        self.directory = Path(directory)
+        self.latency = latency
+
+    def _read(self, symbol: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        path = self.directory / f"{symbol}.csv"
+        if not path.exists():
+            return None
+        data = pd.read_csv(path, index_col=0, parse_dates=True)
+        return data[(data.index >= start_date) & (data.index < end_date)]
+
+    async def fetch(self, symbol: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await asyncio.to_thread(self._read, symbol, start_date, end_date)
+
+
+class InMemoryDataSource(DataSource):
+    """内存数据源（假数据源），直接返回预先准备好的 DataFrame"""
+
+    def __init__(self, frames: Dict[str, pd.DataFrame], latency: float = 0.0,
+                 rate_limit: Optional[float] = None):
+        super().__init__(rate_limit)
+        self.frames = frames
+        self.latency = latency
+
+    async def fetch(self, symbol: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        data = self.frames.get(symbol)
+        if data is None:
+            return None
+        return data[(data.index >= start_date) & (data.index < end_date)]
+
+
+def generate_gbm_prices(n_symbols: int, n_days: int, seed: int = 0,
+                        start_date: str = '2010-01-01') -> Dict[str, pd.DataFrame]:
+    """
+    用几何布朗运动生成 n_symbols 只股票和市场指数（^GSPC）n_days 个交易日的模拟行情，
+    个股收益率 = beta × 市场收益率 + 特异收益率，列与 yfinance 返回的数据一致
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start_date, periods=n_days)
+    dt = 1 / 252
+
+    market_shocks = rng.standard_normal(n_days)
+    market_log_returns = (0.07 - 0.5 * 0.18 ** 2) * dt + 0.18 * np.sqrt(dt) * market_shocks
+
+    betas = rng.uniform(0.5, 1.5, n_symbols)
+    idio_vols = rng.uniform(0.1, 0.4, n_symbols)
+    drifts = rng.uniform(-0.05, 0.15, n_symbols)
+    idio_shocks = rng.standard_normal((n_days, n_symbols))
+    log_returns = (market_log_returns[:, None] * betas
+                   + (drifts - 0.5 * idio_vols ** 2) * dt
+                   + idio_vols * np.sqrt(dt) * idio_shocks)
+
+    def _frame(closes: np.ndarray) -> pd.DataFrame:
+        spread = np.abs(rng.normal(0, 0.005, len(closes)))
+        return pd.DataFrame({
+            'Open': closes * (1 + rng.normal(0, 0.002, len(closes))),
+            'High': closes * (1 + spread),
+            'Low': closes * (1 - spread),
+            'Close': closes,
+            'Volume': rng.integers(10 ** 5, 10 ** 7, len(closes)).astype(np.float64),
+            'Dividends': 0.0,
+            'Stock Splits': 0.0,
+        }, index=pd.DatetimeIndex(dates, name='Date'))
+
+    frames = {StockAnalyzer.market_symbol: _frame(4000 * np.exp(np.cumsum(market_log_returns)))}
+    start_prices = rng.uniform(10, 500, n_symbols)
+    closes = start_prices * np.exp(np.cumsum(log_returns, axis=0))
+    for i in range(n_symbols):
+        frames[f'SYM{i:05d}'] = _frame(closes[:, i])
+    return frames
+
+
+class SyntheticDataSource(InMemoryDataSource):
+    """基于几何布朗运动模拟数据的假数据源，用于基准测试"""
+
+    def __init__(self, n_symbols: int, n_days: int, seed: int = 0, latency: float = 0.0):
+        super().__init__(generate_gbm_prices(n_symbols, n_days, seed), latency=latency)
+        self.symbols = [symbol for symbol in self.frames if symbol != StockAnalyzer.market_symbol]
+
+
+def _metrics_kernel(returns: np.ndarray, market: np.ndarray,
+                    risk_free_rate: float) -> Dict[str, np.ndarray]:
+    """
+    对 日期×股票 收益率矩阵按列一次性计算各项指标，NaN 视为缺失值，
+    每一列只使用与市场收益率同时存在的日期（与 calculate_metrics 的对齐方式一致）
+    """
+    mask = ~np.isnan(returns) & ~np.isnan(market)[:, None]
+    count = mask.sum(axis=0)
+    x = np.where(mask, returns, 0.0)
+    m = np.where(mask, market[:, None], 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 均值、方差与协方差（样本估计，ddof=1）
+        x_mean = x.sum(axis=0) / count
+        m_mean = m.sum(axis=0) / count
+        dx = np.where(mask, x - x_mean, 0.0)
+        dm = np.where(mask, m - m_mean, 0.0)
+        dof = count - 1
+        stock_variance = (dx * dx).sum(axis=0) / dof
+        market_variance = (dm * dm).sum(axis=0) / dof
+        covariance = (dx * dm).sum(axis=0) / dof
+
+        mean_return = x_mean * 252
+        volatility = np.sqrt(stock_variance) * np.sqrt(252)
+        sharpe_ratio = (mean_return - risk_free_rate) / volatility
+        beta = covariance / market_variance
+
+        # 最大回撤：缺失日的收益率记为0，不影响累积收益；
+        # 第一个有效日期之前不参与计算（累积最大值从第一个有效值开始）
+        started = np.logical_or.accumulate(mask, axis=0)
+        cumulative_returns = np.where(started, np.cumprod(1.0 + x, axis=0), 0.0)
+        rolling_max = np.maximum.accumulate(cumulative_returns, axis=0)
+        drawdowns = np.where(started, cumulative_returns / rolling_max - 1, 0.0)
+        max_drawdown = np.where(count > 0, drawdowns.min(axis=0, initial=0.0), np.nan)
+
+    return {
+        'mean_return': mean_return,
+        'volatility': volatility,
+        'sharpe_ratio': sharpe_ratio,
+        'max_drawdown': max_drawdown,
+        'beta': beta,
+    }
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """用前缀和计算沿第0轴的滑动窗口和，O(n)"""
+    cumulative = np.cumsum(values, axis=0)
+    cumulative[window:] -= cumulative[:-window].copy()
+    return cumulative
+
+
+def _rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    van Herk/Gil-Werman 算法计算沿第0轴的滑动窗口最大值：
+    按窗口长度分块，分别求块内前缀最大值和后缀最大值，每个窗口只需比较两个值，O(n)
+    """
+    length, width = values.shape
+    padding = (-length) % window
+    padded = np.concatenate([values, np.full((padding, width), -np.inf)]).reshape(-1, window, width)
+    prefix = np.maximum.accumulate(padded, axis=1).reshape(-1, width)[:length]
+    suffix = np.maximum.accumulate(padded[:, ::-1], axis=1)[:, ::-1].reshape(-1, width)[:length]
+    result = prefix.copy()
+    if window <= length:
+        # 窗口比序列长时所有位置都落在第一个块内，结果就是前缀最大值
+        result[window - 1:] = np.maximum(suffix[:length - window + 1], prefix[window - 1:])
+    return result
+
+
+def _lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样：保留首尾两点，其余每个桶中选出
+    与上一个选中点、下一个桶均值点构成三角形面积最大的点，返回选中点的下标
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    bucket_size = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _draw_performance(ax1, ax2, payload: dict) -> None:
+    """在给定的两个坐标轴上绘制累积收益对比和风险收益散点图"""
+    # 绘制累积收益对比
+    for symbol, dates, values in payload['series']:
+        ax1.plot(dates, values, label=symbol)
+
+    ax1.set_title('Cumulative Returns Comparison')
+    ax1.set_xlabel('Date')
+    ax1.set_ylabel('Cumulative Return')
+    ax1.legend()
+    ax1.grid(True)
+
+    # 绘制风险收益散点图
+    metrics = payload['metrics']
+    if metrics:
+        ax2.scatter([vol for _, vol, _ in metrics], [ret for _, _, ret in metrics])
+
+        # 添加标签
+        for symbol, vol, ret in metrics:
+            ax2.annotate(
+                symbol,
+                (vol, ret),
+                xytext=(5, 5),
+                textcoords='offset points'
+            )
+
+    ax2.set_title('Risk-Return Profile')
+    ax2.set_xlabel('Volatility (Risk)')
+    ax2.set_ylabel('Expected Return')
+    ax2.grid(True)
+
+
+def _render_performance(payload: dict, output: Union[str, os.PathLike, BinaryIO],
+                        fmt: Optional[str] = None) -> None:
+    """
+    无界面渲染：直接使用 Figure 和 Agg 画布，不经过 pyplot 的全局状态，
+    可以在线程或子进程中并行调用
+    """
+    fig = Figure(figsize=(15, 12))
+    FigureCanvasAgg(fig)
+    ax1, ax2 = fig.subplots(2, 1)
+    _draw_performance(ax1, ax2, payload)
+    fig.tight_layout()
+    fig.savefig(output, format=fmt)
+
+
+# 多进程扫描时每个工作进程挂载的共享收益率矩阵：(共享内存, 收益率矩阵, 市场收益率)
+_shared_returns: Optional[Tuple[shared_memory.SharedMemory, np.ndarray, np.ndarray]] = None
+
+
+def _attach_shared_returns(name: str, shape: Tuple[int, int], market: np.ndarray) -> None:
+    """进程池初始化函数：挂载共享内存中的收益率矩阵（按列存储，列块连续）"""
+    global _shared_returns
+    shm = shared_memory.SharedMemory(name=name)
+    returns = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order='F')
+    _shared_returns = (shm, returns, market)
+
+
+def _scan_block(start: int, stop: int, risk_free_rate: float) -> Tuple[int, Dict[str, np.ndarray]]:
+    """在工作进程中计算第 start 到 stop 列的指标"""
+    _, returns, market = _shared_returns
+    return start, _metrics_kernel(returns[:, start:stop], market, risk_free_rate)
+
+
 class StockAnalyzer:
     """股票数据分析类"""
 
-    def __init__(self, risk_free_rate: float = 0.02):
+    market_symbol = '^GSPC'  # 市场指数（以S&P500为例）
+
+    def __init__(self, risk_free_rate: float = 0.02, cache: Optional[PriceCache] = None,
+                 source: Optional[DataSource] = None, max_concurrency: int = 5,
+                 max_retries: int = 2, retry_backoff: float = 0.5, max_cache_size: int = 4096,
+                 compact: bool = False, compact_dtype=np.float32):
         self.risk_free_rate = risk_free_rate
+        self.cache = cache
+        self.source = source if source is not None else YahooDataSource()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
         self._market_data: Optional[pd.DataFrame] = None
-        self._stocks_data: Dict[str, pd.DataFrame] = {}
+        # 紧凑模式下只常驻收盘价矩阵，其他列从缓存或数据源按需加载
+        self._stocks_data: MutableMapping[str, pd.DataFrame] = (
+            CompactPriceStore(compact_dtype, loader=self._load_full) if compact else {}
+        )
+        self._date_range: Optional[Tuple[str, str]] = None
+        # 指标缓存：键中包含数据版本，数据被替换后旧结果自然失效，按 LRU 淘汰
+        self.max_cache_size = max_cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._versions = itertools.count(1)
+        self._data_versions: Dict[str, int] = {}
+        self._market_version = 0
+        # 增量（流式）模式的状态
+        self._online: Dict[str, OnlineMetrics] = {}
+        self._last_market_close: Optional[float] = None
 
-    # 在 fetch_data 方法中修改市场数据获取部分
-    def fetch_data(self, symbols: List[str], start_date: str, end_date: str) -> None:
-        """
-        获取股票数据，使用多线程提高效率
-        """
+    def _set_stock_data(self, symbol: str, data: pd.DataFrame) -> None:
+        """替换股票数据并更新其数据版本"""
+        self._stocks_data[symbol] = data
+        self._data_versions[symbol] = next(self._versions)
+
+    def _set_market_data(self, data: Optional[pd.DataFrame]) -> None:
+        """替换市场指数数据并更新市场数据版本"""
+        self._market_data = data
+        self._market_version = next(self._versions)
+
+    def _cache_get(self, key: tuple):
+        value = self._cache.get(key)
+        if value is not None:
+            self._cache.move_to_end(key)
+        return value
 
-        def _fetch_single_stock(symbol: str) -> Tuple[str, Optional[pd.DataFrame]]:
+    def _cache_put(self, key: tuple, value) -> None:
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cache_size:
+            self._cache.popitem(last=False)
+
+    def _metrics_key(self, symbol: str) -> tuple:
+        return ('metrics', symbol, self._data_versions.get(symbol, 0),
+                self._market_version, self.risk_free_rate)
+
+    async def _fetch_with_retry(self, symbol: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        """从数据源获取数据，失败时按指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            await self.source.throttle()
             try:
-                stock = yf.Ticker(symbol)
-                data = stock.history(start=start_date, end=end_date)
-                # 确保时区一致
-                data.index = data.index.tz_localize(None)
-                return symbol, data
+                return await self.source.fetch(symbol, start_date, end_date)
             except Exception as e:
-                logger.error(f"Error fetching data for {symbol}: {str(e)}")
-                return symbol, None
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * 2 ** attempt
+                logger.warning(f"Fetching {symbol} failed ({str(e)}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        return None
+
+    async def _load(self, symbol: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        """获取单只股票数据，配置了缓存时只下载缓存中缺失的区间"""
+        if self.cache is None:
+            return await self._fetch_with_retry(symbol, start_date, end_date)
+        return await self.cache.get(symbol, start_date, end_date, self._fetch_with_retry)
+
+    async def stream_data(self, symbols: List[str], start_date: str,
+                          end_date: str) -> AsyncIterator[Tuple[str, Optional[pd.DataFrame]]]:
+        """
+        并发获取多只股票数据（并发数由 max_concurrency 控制），
+        按完成顺序逐个产出 (symbol, data)，获取失败时 data 为 None
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
 
-        # 获取市场指数数据（以S&P500为例）
+        async def _fetch_single_stock(symbol: str) -> Tuple[str, Optional[pd.DataFrame]]:
+            async with semaphore:
+                try:
+                    return symbol, await self._load(symbol, start_date, end_date)
+                except Exception as e:
+                    logger.error(f"Error fetching data for {symbol}: {str(e)}")
+                    return symbol, None
+
+        tasks = [asyncio.create_task(_fetch_single_stock(symbol)) for symbol in symbols]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def fetch_data_async(self, symbols: List[str], start_date: str, end_date: str) -> None:
+        """异步获取市场指数和股票数据，市场指数与个股并发获取"""
+        self._date_range = (start_date, end_date)
+        market_task = asyncio.create_task(self._load(self.market_symbol, start_date, end_date))
         try:
-            self._market_data = yf.download('^GSPC', start=start_date, end=end_date)
-            # 移除时区信息
-            self._market_data.index = self._market_data.index.tz_localize(None)
+            async for symbol, data in self.stream_data(symbols, start_date, end_date):
+                if data is not None:
+                    self._set_stock_data(symbol, data)
+        finally:
+            if not market_task.done():
+                await asyncio.wait([market_task])
+
+        try:
+            self._set_market_data(market_task.result())
         except Exception as e:
             logger.error(f"Error fetching market data: {str(e)}")
             raise
+        if self._market_data is None:
+            raise ValueError(f"No market data available for {self.market_symbol}")
 
-        # 使用线程池并行获取多个股票数据
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            results = executor.map(lambda x: _fetch_single_stock(x), symbols)
+    def fetch_data(self, symbols: List[str], start_date: str, end_date: str) -> None:
+        """
+        获取股票数据，使用 asyncio 并发获取以提高效率
+        """
+        asyncio.run(self.fetch_data_async(symbols, start_date, end_date))
 
-        for symbol, data in results:
+    def _load_full(self, symbol: str) -> Optional[pd.DataFrame]:
+        """紧凑模式下按需重新加载股票的所有列（优先读取本地缓存）"""
+        if self._date_range is None:
+            return None
+        start_date, end_date = self._date_range
+        if self.cache is not None:
+            data = self.cache.load(symbol, start_date, end_date)
             if data is not None:
-                self._stocks_data[symbol] = data
+                return data
+        return asyncio.run(self._fetch_with_retry(symbol, start_date, end_date))
+
+    def get_stock_data(self, symbol: str) -> Optional[pd.DataFrame]:
+        """获取股票的完整数据，紧凑模式下其他列按需加载"""
+        if isinstance(self._stocks_data, CompactPriceStore):
+            return self._stocks_data.full(symbol)
+        return self._stocks_data.get(symbol)
 
     def calculate_metrics(self, symbol: str) -> Optional[StockMetrics]:
-        """计算单个股票的各项指标"""
+        """计算单个股票的各项指标，结果按数据版本和无风险利率缓存"""
+        key = self._metrics_key(symbol)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
         try:
             stock_data = self._stocks_data.get(symbol)
             if stock_data is None:
@@ -79,7 +785,7 @@ class StockAnalyzer:
 
             # 计算日收益率
             stock_returns = stock_data['Close'].pct_change().dropna()
-            market_returns = self._market_data['Close'].pct_change().dropna()
+            market_returns = self._market_returns()
 
             # 确保数据对齐
             aligned_data = pd.concat([stock_returns, market_returns], axis=1).dropna()
@@ -104,7 +810,7 @@ class StockAnalyzer:
             market_variance = market_returns.var()
             beta = covariance / market_variance
 
-            return StockMetrics(
+            metrics = StockMetrics(
                 symbol=symbol,
                 mean_return=mean_return,
                 volatility=volatility,
@@ -112,76 +818,398 @@ class StockAnalyzer:
                 max_drawdown=max_drawdown,
                 beta=beta
             )
+            self._cache_put(key, metrics)
+            return metrics
 
         except Exception as e:
             logger.error(f"Error calculating metrics for {symbol}: {str(e)}")
             return None
 
-    def plot_performance_comparison(self, symbols: List[str]) -> None:
-        """绘制股票表现对比图"""
-        plt.figure(figsize=(15, 10))
+    def _market_returns(self) -> pd.Series:
+        """计算市场指数日收益率，按市场数据版本缓存"""
+        key = ('market_returns', self._market_version)
+        market_returns = self._cache_get(key)
+        if market_returns is None:
+            market_close = self._market_data['Close']
+            if isinstance(market_close, pd.DataFrame):  # yf.download 可能返回多级列
+                market_close = market_close.iloc[:, 0]
+            market_returns = market_close.pct_change().dropna()
+            self._cache_put(key, market_returns)
+        return market_returns
 
-        # 创建子图
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 12))
+    def _cumulative_returns(self, symbol: str) -> pd.Series:
+        """计算累积收益曲线，按数据版本缓存"""
+        key = ('cumulative', symbol, self._data_versions.get(symbol, 0))
+        cumulative_returns = self._cache_get(key)
+        if cumulative_returns is None:
+            returns = self._stocks_data[symbol]['Close'].pct_change()
+            cumulative_returns = (1 + returns).cumprod()
+            self._cache_put(key, cumulative_returns)
+        return cumulative_returns
+
+    def _aligned_returns(self, symbols: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        将多只股票的日收益率按市场指数日期对齐成 日期×股票 矩阵，缺失值为 NaN
+        返回 (有数据的股票列表, 收益率矩阵, 市场收益率向量)
+        """
+        market_returns = self._market_returns()
+        market = market_returns.to_numpy(dtype=np.float64)
+        valid_symbols = [symbol for symbol in dict.fromkeys(symbols) if symbol in self._stocks_data]
+
+        # 直接在 NumPy 中计算收益率并按日期位置写入矩阵，避免逐列 pd.concat 的开销
+        returns = np.full((len(market), len(valid_symbols)), np.nan)
+        for j, symbol in enumerate(valid_symbols):
+            close = self._stocks_data[symbol]['Close']
+            values = close.to_numpy(dtype=np.float64)
+            if len(values) < 2:
+                continue
+            positions = market_returns.index.get_indexer(close.index[1:])
+            found = positions >= 0
+            returns[positions[found], j] = (values[1:] / values[:-1] - 1)[found]
+        return valid_symbols, returns, market
+
+    def calculate_metrics_batch(self, symbols: List[str]) -> Dict[str, StockMetrics]:
+        """
+        批量计算多只股票的指标：市场收益率只计算一次，
+        所有股票对齐为一个收益率矩阵后用 NumPy 向量化计算，已缓存的结果直接复用
+        """
+        found: Dict[str, StockMetrics] = {}
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            if symbol not in self._stocks_data:
+                continue
+            cached = self._cache_get(self._metrics_key(symbol))
+            if cached is not None:
+                found[symbol] = cached
+            else:
+                missing.append(symbol)
+
+        if missing:
+            try:
+                valid_symbols, returns, market = self._aligned_returns(missing)
+                results = _metrics_kernel(returns, market, self.risk_free_rate)
+            except Exception as e:
+                logger.error(f"Error calculating batch metrics: {str(e)}")
+            else:
+                found.update(self._store_results(valid_symbols, results))
+
+        return {symbol: found[symbol] for symbol in dict.fromkeys(symbols) if symbol in found}
+
+    def _store_results(self, symbols: List[str], results: Dict[str, np.ndarray]) -> Dict[str, StockMetrics]:
+        """将按列计算的指标数组转换为 StockMetrics 并写入缓存"""
+        metrics_by_symbol = {}
+        for i, symbol in enumerate(symbols):
+            metrics = StockMetrics(
+                symbol=symbol,
+                mean_return=float(results['mean_return'][i]),
+                volatility=float(results['volatility'][i]),
+                sharpe_ratio=float(results['sharpe_ratio'][i]),
+                max_drawdown=float(results['max_drawdown'][i]),
+                beta=float(results['beta'][i])
+            )
+            self._cache_put(self._metrics_key(symbol), metrics)
+            metrics_by_symbol[symbol] = metrics
+        return metrics_by_symbol
+
+    def scan_universe(self, symbols: List[str], workers: Optional[int] = None,
+                      block_size: int = 256) -> Dict[str, StockMetrics]:
+        """
+        多进程扫描大量股票：对齐后的收益率矩阵只写入共享内存一次，
+        各工作进程按列块读取共享矩阵计算指标，不需要序列化 DataFrame
+        """
+        valid_symbols, returns, market = self._aligned_returns(symbols)
+        if not valid_symbols:
+            return {}
+
+        shape = returns.shape
+        shm = shared_memory.SharedMemory(create=True, size=max(returns.nbytes, 1))
+        try:
+            shared = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order='F')
+            shared[:] = returns
+            del returns
+
+            columns: Dict[str, np.ndarray] = {}
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared_returns,
+                                     initargs=(shm.name, shape, market)) as executor:
+                futures = [
+                    executor.submit(_scan_block, start, min(start + block_size, shape[1]), self.risk_free_rate)
+                    for start in range(0, shape[1], block_size)
+                ]
+                blocks = dict(future.result() for future in as_completed(futures))
+
+            for name in blocks[0]:
+                columns[name] = np.concatenate([blocks[start][name] for start in sorted(blocks)])
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return self._store_results(valid_symbols, columns)
+
+    def rolling_metrics(self, symbols: List[str], windows: Tuple[int, ...] = (60, 120, 252),
+                        min_periods: Optional[int] = None) -> Dict[int, Dict[str, pd.DataFrame]]:
+        """
+        批量计算滚动窗口指标，返回 {窗口长度: {指标名: 日期×股票 DataFrame}}，
+        指标包括年化收益率、波动率、夏普比率、贝塔系数和相对窗口内高点的回撤；
+        均值、方差和协方差由前缀和得到，回撤使用分块滑动最大值，每个窗口长度的代价为 O(n)
+        窗口内有效数据少于 min_periods（默认等于窗口长度）时结果为 NaN
+        """
+        valid_symbols, returns, market = self._aligned_returns(symbols)
+        dates = self._market_returns().index
+        mask = ~np.isnan(returns) & ~np.isnan(market)[:, None]
+        x = np.where(mask, returns, 0.0)
+        m = np.where(mask, market[:, None], 0.0)
+
+        # 先减去全样本均值再累加，减小前缀和相减时的舍入误差（方差和协方差不受平移影响）
+        with np.errstate(divide='ignore', invalid='ignore'):
+            count_total = mask.sum(axis=0)
+            x_shift = np.where(count_total > 0, x.sum(axis=0) / count_total, 0.0)
+            m_shift = np.where(count_total > 0, m.sum(axis=0) / count_total, 0.0)
+        dx = np.where(mask, x - x_shift, 0.0)
+        dm = np.where(mask, m - m_shift, 0.0)
+
+        # 对数累积收益，第一个有效日期之前记为 -inf，不作为回撤的高点
+        started = np.logical_or.accumulate(mask, axis=0)
+        log_wealth = np.where(started, np.cumsum(np.log1p(x), axis=0), -np.inf)
+
+        results: Dict[int, Dict[str, pd.DataFrame]] = {}
+        for window in windows:
+            required = window if min_periods is None else min_periods
+            count = _rolling_sum(mask.astype(np.float64), window)
+            sum_x = _rolling_sum(dx, window)
+            sum_m = _rolling_sum(dm, window)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean_x = sum_x / count
+                mean_m = sum_m / count
+                dof = count - 1
+                stock_variance = np.maximum(_rolling_sum(dx * dx, window) - sum_x * mean_x, 0.0) / dof
+                market_variance = np.maximum(_rolling_sum(dm * dm, window) - sum_m * mean_m, 0.0) / dof
+                covariance = (_rolling_sum(dx * dm, window) - sum_x * mean_m) / dof
+
+                mean_return = (mean_x + x_shift) * 252
+                volatility = np.sqrt(stock_variance) * np.sqrt(252)
+                sharpe_ratio = (mean_return - self.risk_free_rate) / volatility
+                beta = covariance / market_variance
+                drawdown = np.exp(log_wealth - _rolling_max(log_wealth, window)) - 1
+
+            insufficient = count < max(required, 1)
+            metrics = {
+                'mean_return': mean_return,
+                'volatility': volatility,
+                'sharpe_ratio': sharpe_ratio,
+                'beta': beta,
+                'drawdown': drawdown,
+            }
+            results[window] = {
+                name: pd.DataFrame(np.where(insufficient, np.nan, values), index=dates, columns=valid_symbols)
+                for name, values in metrics.items()
+            }
+        return results
+
+    def covariance_matrix(self, symbols: List[str], correlation: bool = False, block_size: int = 512,
+                          dtype=np.float64, shrinkage: Union[float, str, None] = None,
+                          out_path: Optional[str] = None) -> pd.DataFrame:
+        """
+        计算多只股票日收益率的协方差矩阵（correlation=True 时为相关系数矩阵），
+        缺失值按成对完整观测处理（与 DataFrame.cov/corr 一致）；
+        按 block_size 列分块做矩阵乘法，临时内存只与块大小有关，结果可通过 out_path 写入内存映射文件；
+        dtype 可选 float32 以减半内存；
+        shrinkage 为 [0, 1] 之间的收缩强度或 'ledoit-wolf'（自动估计强度），收缩目标为对角阵
+        """
+        valid_symbols, returns, _ = self._aligned_returns(symbols)
+        n_symbols = len(valid_symbols)
+        mask = ~np.isnan(returns)
+        # 先减去列均值，减小大数相减的舍入误差（协方差不受平移影响）
+        with np.errstate(invalid='ignore'):
+            column_means = np.where(mask.any(axis=0), np.nanmean(np.where(mask, returns, np.nan), axis=0), 0.0)
+        x = np.where(mask, returns - column_means, 0.0).astype(dtype)
+        x_squared = x * x
+        m = mask.astype(dtype)
+        del returns
+
+        if out_path is not None:
+            result = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=(n_symbols, n_symbols))
+        else:
+            result = np.empty((n_symbols, n_symbols), dtype=dtype)
+
+        # Ledoit-Wolf 收缩强度所需的累加量（基于补零后的去均值收益率）
+        ledoit_wolf = shrinkage == 'ledoit-wolf'
+        lw_beta = lw_delta = 0.0
+
+        for i in range(0, n_symbols, block_size):
+            rows = slice(i, min(i + block_size, n_symbols))
+            for j in range(i, n_symbols, block_size):
+                cols = slice(j, min(j + block_size, n_symbols))
+                count = m[:, rows].T @ m[:, cols]
+                sum_xy = x[:, rows].T @ x[:, cols]
+                sum_x = x[:, rows].T @ m[:, cols]
+                sum_y = m[:, rows].T @ x[:, cols]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    co_moment = sum_xy - sum_x * sum_y / count
+                    if correlation:
+                        ss_x = x_squared[:, rows].T @ m[:, cols] - sum_x * sum_x / count
+                        ss_y = m[:, rows].T @ x_squared[:, cols] - sum_y * sum_y / count
+                        block = co_moment / np.sqrt(ss_x * ss_y)
+                    else:
+                        block = co_moment / (count - 1)
+                result[rows, cols] = block
+                if j != i:
+                    result[cols, rows] = block.T
+
+                if ledoit_wolf:
+                    weight = 1 if j == i else 2  # 非对角块对称出现两次
+                    lw_beta += weight * float((x_squared[:, rows].T @ x_squared[:, cols]).sum())
+                    lw_delta += weight * float((sum_xy.astype(np.float64) ** 2).sum())
 
-        # 绘制累积收益对比
+        if shrinkage is not None and n_symbols:
+            if ledoit_wolf:
+                n_obs = len(x)
+                trace = x_squared.sum(axis=0, dtype=np.float64) / n_obs
+                mu = trace.sum() / n_symbols
+                lw_delta /= n_obs ** 2
+                beta = (lw_beta / n_obs - lw_delta) / (n_symbols * n_obs)
+                delta = (lw_delta - 2 * mu * trace.sum() + n_symbols * mu ** 2) / n_symbols
+                intensity = 0.0 if delta == 0 else min(beta, delta) / delta
+            else:
+                intensity = float(shrinkage)
+            target = 1.0 if correlation else np.nanmean(np.diagonal(result))
+            result *= 1 - intensity
+            result[np.diag_indices(n_symbols)] += intensity * target
+
+        return pd.DataFrame(result, index=valid_symbols, columns=valid_symbols)
+
+    def start_streaming(self, symbols: List[str]) -> None:
+        """用已获取的历史数据初始化增量计算状态，之后可通过 push_bar 推送新K线"""
+        valid_symbols, returns, market = self._aligned_returns(symbols)
+        market_close = self._market_data['Close']
+        if isinstance(market_close, pd.DataFrame):
+            market_close = market_close.iloc[:, 0]
+        self._last_market_close = float(market_close.iloc[-1]) if len(market_close) else None
+
+        for i, symbol in enumerate(valid_symbols):
+            column = returns[:, i]
+            valid = ~np.isnan(column)
+            closes = self._stocks_data[symbol]['Close']
+            last_close = float(closes.iloc[-1]) if len(closes) else None
+            self._online[symbol] = OnlineMetrics.from_history(
+                symbol, column[valid], market[valid], last_close
+            )
+
+    def push_bar(self, market_close: Optional[float], closes: Dict[str, float]) -> None:
+        """
+        推送一根新K线：市场指数收盘价和各股票收盘价，
+        只有同时存在股票和市场收益率的K线才计入指标（与历史数据的对齐方式一致）
+        """
+        market_return = float('nan')
+        if market_close is not None:
+            if self._last_market_close is not None:
+                market_return = market_close / self._last_market_close - 1
+            self._last_market_close = market_close
+
+        for symbol, close in closes.items():
+            acc = self._online.get(symbol)
+            if acc is None:
+                acc = self._online[symbol] = OnlineMetrics(symbol)
+            if close is None:
+                continue
+            if acc.last_close is not None and not np.isnan(market_return):
+                acc.update(close / acc.last_close - 1, market_return)
+            acc.last_close = close
+
+    def get_streaming_metrics(self, symbol: str) -> Optional[StockMetrics]:
+        """读取增量模式下的当前指标，O(1)"""
+        acc = self._online.get(symbol)
+        if acc is None:
+            return None
+        return acc.metrics(self.risk_free_rate)
+
+    def _plot_payload(self, symbols: List[str], max_points: Optional[int]) -> dict:
+        """准备绘图数据：累积收益曲线用 LTTB 降采样到最多 max_points 个点"""
+        series = []
         for symbol in symbols:
             if symbol in self._stocks_data:
-                returns = self._stocks_data[symbol]['Close'].pct_change()
-                cumulative_returns = (1 + returns).cumprod()
-                ax1.plot(cumulative_returns.index, cumulative_returns, label=symbol)
-
-        ax1.set_title('Cumulative Returns Comparison')
-        ax1.set_xlabel('Date')
-        ax1.set_ylabel('Cumulative Return')
-        ax1.legend()
-        ax1.grid(True)
-
-        # 绘制风险收益散点图
-        metrics = []
-        for symbol in symbols:
-            metric = self.calculate_metrics(symbol)
-            if metric:
-                metrics.append(metric)
-
-        if metrics:
-            returns = [m.mean_return for m in metrics]
-            vols = [m.volatility for m in metrics]
-            ax2.scatter(vols, returns)
-
-            # 添加标签
-            for metric in metrics:
-                ax2.annotate(
-                    metric.symbol,
-                    (metric.volatility, metric.mean_return),
-                    xytext=(5, 5),
-                    textcoords='offset points'
-                )
-
-        ax2.set_title('Risk-Return Profile')
-        ax2.set_xlabel('Volatility (Risk)')
-        ax2.set_ylabel('Expected Return')
-        ax2.grid(True)
+                cumulative_returns = self._cumulative_returns(symbol).dropna()
+                dates = cumulative_returns.index.to_numpy()
+                values = cumulative_returns.to_numpy(dtype=np.float64)
+                if max_points is not None and len(values) > max_points:
+                    selected = _lttb(dates.astype('datetime64[ns]').astype(np.int64).astype(np.float64),
+                                     values, max_points)
+                    dates, values = dates[selected], values[selected]
+                series.append((symbol, dates, values))
 
+        metrics = [(m.symbol, m.volatility, m.mean_return)
+                   for m in self.calculate_metrics_batch(symbols).values()]
+        return {'series': series, 'metrics': metrics}
+
+    def plot_performance_comparison(self, symbols: List[str],
+                                    output: Union[str, os.PathLike, BinaryIO, None] = None,
+                                    fmt: Optional[str] = None, max_points: Optional[int] = 2000) -> None:
+        """
+        绘制股票表现对比图，每条曲线降采样到最多 max_points 个点（None 表示不降采样）
+        指定 output（文件路径或缓冲区）时以无界面模式渲染为 PNG/SVG 等格式，否则弹出窗口显示
+        """
+        payload = self._plot_payload(symbols, max_points)
+        if output is not None:
+            _render_performance(payload, output, fmt)
+            return
+
+        # 创建子图
+        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 12))
+        _draw_performance(ax1, ax2, payload)
         plt.tight_layout()
         plt.show()
 
-    def generate_report(self, symbols: List[str]) -> pd.DataFrame:
-        """生成分析报告"""
-        metrics_list = []
-        for symbol in symbols:
-            metrics = self.calculate_metrics(symbol)
-            if metrics:
-                metrics_list.append({
-                    'Symbol': metrics.symbol,
-                    'Annual Return': f"{metrics.mean_return:.2%}",
-                    'Volatility': f"{metrics.volatility:.2%}",
-                    'Sharpe Ratio': f"{metrics.sharpe_ratio:.2f}",
-                    'Max Drawdown': f"{metrics.max_drawdown:.2%}",
-                    'Beta': f"{metrics.beta:.2f}"
-                })
+    def render_performance_batches(self, batches: List[List[str]], output_dir: str, fmt: str = 'png',
+                                   max_points: Optional[int] = 2000,
+                                   workers: Optional[int] = None) -> List[str]:
+        """
+        并行渲染多组股票的对比图：在主进程中准备好降采样后的数据，
+        由进程池渲染并写入 output_dir/chart_<序号>.<fmt>，返回文件路径列表
+        """
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        paths = [str(Path(output_dir) / f"chart_{i:04d}.{fmt}") for i in range(len(batches))]
+        payloads = [self._plot_payload(symbols, max_points) for symbols in batches]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_render_performance, payload, path, fmt)
+                       for payload, path in zip(payloads, paths)]
+            for future in futures:
+                future.result()
+        return paths
+
+    def generate_report(self, symbols: List[str], numeric: bool = False) -> pd.DataFrame:
+        """
+        生成分析报告，numeric=True 时返回数值列（float64）的报告，
+        否则返回格式化为字符串的报告（格式化只用于显示）
+        """
+        metrics = list(self.calculate_metrics_batch(symbols).values())
+        report = pd.DataFrame({
+            'Symbol': pd.Series([m.symbol for m in metrics], dtype=object),
+            'Annual Return': np.array([m.mean_return for m in metrics], dtype=np.float64),
+            'Volatility': np.array([m.volatility for m in metrics], dtype=np.float64),
+            'Sharpe Ratio': np.array([m.sharpe_ratio for m in metrics], dtype=np.float64),
+            'Max Drawdown': np.array([m.max_drawdown for m in metrics], dtype=np.float64),
+            'Beta': np.array([m.beta for m in metrics], dtype=np.float64),
+        })
+        return report if numeric else self.format_report(report)
 
-        return pd.DataFrame(metrics_list)
+    @staticmethod
+    def format_report(report: pd.DataFrame) -> pd.DataFrame:
+        """将数值报告格式化为便于阅读的字符串"""
+        formatted = report.copy()
+        for column in ('Annual Return', 'Volatility', 'Max Drawdown'):
+            formatted[column] = report[column].map('{:.2%}'.format)
+        for column in ('Sharpe Ratio', 'Beta'):
+            formatted[column] = report[column].map('{:.2f}'.format)
+        return formatted
+
+    def export_report(self, symbols: List[str], path: str) -> None:
+        """将数值报告按文件扩展名导出为 CSV 或 Parquet（Parquet 需要安装 pyarrow）"""
+        report = self.generate_report(symbols, numeric=True)
+        if Path(path).suffix.lower() == '.parquet':
+            report.to_parquet(path, index=False)
+        else:
+            report.to_csv(path, index=False)
 
 
 def main():
@@ -212,5 +1240,78 @@ def main():
         raise
 
 
+def _time_scenario(func: Callable[[], None], repeat: int,
+                   setup: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """多次运行 func，返回耗时统计（秒）"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'mean': statistics.mean(timings), 'max': max(timings)}
+
+
+def run_benchmark(n_symbols: int = 500, n_days: int = 2520, seed: int = 0, repeat: int = 3,
+                  plot_symbols: int = 20, output: Optional[str] = None) -> dict:
+    """
+    使用模拟数据源运行基准测试：数据获取、单只指标计算、批量指标计算、报告和绘图，
+    结果以 JSON 格式保存，便于不同版本之间对比
+    """
+    source = SyntheticDataSource(n_symbols, n_days, seed)
+    symbols = source.symbols
+    dates = source.frames[StockAnalyzer.market_symbol].index
+    start_date = dates[0].strftime('%Y-%m-%d')
+    end_date = (dates[-1] + timedelta(days=1)).strftime('%Y-%m-%d')
+    analyzer = StockAnalyzer(source=source, max_cache_size=4 * n_symbols + 16)
+
+    def _fetch() -> None:
+        analyzer.fetch_data(symbols, start_date, end_date)
+
+    def _metrics_single() -> None:
+        for symbol in symbols:
+            analyzer.calculate_metrics(symbol)
+
+    def _plot() -> None:
+        analyzer.plot_performance_comparison(symbols[:plot_symbols], output=io.BytesIO(), fmt='png')
+
+    scenarios = {'fetch': _time_scenario(_fetch, repeat)}
+    clear_cache = analyzer._cache.clear
+    scenarios['metrics_single'] = _time_scenario(_metrics_single, repeat, clear_cache)
+    scenarios['metrics_batch'] = _time_scenario(lambda: analyzer.calculate_metrics_batch(symbols),
+                                                repeat, clear_cache)
+    scenarios['report'] = _time_scenario(lambda: analyzer.generate_report(symbols), repeat, clear_cache)
+    scenarios['report_numeric'] = _time_scenario(lambda: analyzer.generate_report(symbols, numeric=True),
+                                                 repeat, clear_cache)
+    scenarios['plot'] = _time_scenario(_plot, repeat, clear_cache)
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': {'n_symbols': n_symbols, 'n_days': n_days, 'seed': seed,
+                   'repeat': repeat, 'plot_symbols': plot_symbols},
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'pandas': pd.__version__, 'machine': platform.machine()},
+        'scenarios': scenarios,
+    }
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='股票数据分析')
+    parser.add_argument('--benchmark', action='store_true', help='使用模拟数据运行基准测试')
+    parser.add_argument('--symbols', type=int, default=500, help='基准测试的股票数量')
+    parser.add_argument('--days', type=int, default=2520, help='基准测试的交易日数量')
+    parser.add_argument('--seed', type=int, default=0, help='模拟数据的随机种子')
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景的重复次数')
+    parser.add_argument('--output', help='基准测试结果的 JSON 文件路径')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(run_benchmark(args.symbols, args.days, args.seed, args.repeat,
+                                       output=args.output), indent=2))
+    else:
+        main()
\ No newline at end of file